@@ -2,10 +2,15 @@ import cv2
 import torch
 import numpy as np
 import json
+import os
 import sys
 import argparse
 # from ultralytics import YOLO
 
+# geometry.py lives in src/shared (mounted at /shared by docker-compose, copied in by the Docker build)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+from geometry import FOCAL_LENGTH_PX, box_medians, calibration_constant, line_median
+
 # --- ARGUMENTS ---
 parser = argparse.ArgumentParser()
 parser.add_argument('--image', type=str, required=True)
@@ -15,8 +20,6 @@ parser.add_argument('--height', type=float, required=True) # Real height in mete
 parser.add_argument('--method', type=str, default="box")   # "box" or "line"
 args = parser.parse_args()
 
-FOCAL_LENGTH_PX = 1200 
-
 def run_calibration():
     # 1. LOAD IMAGE
     frame = cv2.imread(args.image)
@@ -42,27 +45,13 @@ def run_calibration():
     # Coords come in as string "x1,y1,x2,y2"
     c = list(map(int, args.coords.split(',')))
     
-    raw_val = None
     if args.method == 'box':
-        x1, x2 = sorted([c[0], c[2]])
-        y1, y2 = sorted([c[1], c[3]])
-        # Safety clamp
-        h, w = depth_map.shape
-        x1, x2 = max(0, x1), min(w, x2)
-        y1, y2 = max(0, y1), min(h, y2)
-        
-        crop = depth_map[y1:y2, x1:x2]
-        if crop.size > 0:
-            raw_val = np.median(crop)
+        raw_val = box_medians(depth_map, [c])[0]
     else:
         # Line logic
-        mask = np.zeros_like(depth_map, dtype=np.uint8)
-        cv2.line(mask, (c[0], c[1]), (c[2], c[3]), 255, 2)
-        vals = depth_map[mask == 255]
-        if vals.size > 0:
-            raw_val = np.median(vals)
+        raw_val = line_median(depth_map, (c[0], c[1]), (c[2], c[3]))
 
-    if raw_val is None:
+    if np.isnan(raw_val):
         print(json.dumps({"error": "Selection empty or out of bounds"}))
         sys.exit(1)
 
@@ -72,7 +61,7 @@ def run_calibration():
         print(json.dumps({"error": "Height in pixels is 0"}))
         sys.exit(1)
         
-    final_c = ((args.height * FOCAL_LENGTH_PX) / px_h) * raw_val
+    final_c = calibration_constant(args.height, px_h, raw_val, FOCAL_LENGTH_PX)
 
     # 5. SAVE RESULT
     result = {
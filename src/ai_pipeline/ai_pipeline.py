@@ -1,16 +1,29 @@
 import os
+import sys
 import cv2
-import torch
 import numpy as np
-from ultralytics import YOLO
 import time
-import tensorflow as tf
 import json
 import datetime
 import requests
-from flask import Flask, request, jsonify
 import base64
-import math
+from urllib.parse import quote
+import asyncio
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+# Modules shared with other services live in src/shared, the Docker build copies them next to this file
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+from frame_grabber import GRABBER_PARAMS, GrabberPool, fetch_camera_registry, parse_static_sources
+from frame_ring import FrameRingReader
+from scene_gate import SceneChangeGate
+from depth_cache import DepthCache
+from alert_publisher import AlertPublisher
+from fire_tracker import FireTracker
+from roi_tiler import ROI_PARAMS, RoiTiler
+from poll_scheduler import SCHED_PARAMS, PollScheduler
+from geometry import PoseCache, box_medians, distances, project
+from staged_pipeline import STAGE_PARAMS, StagedPipeline
+from backends import INFERENCE_THREADS, load_classifier, load_depth, load_detector, model_path
 
 # --- CONFIGURATION ---
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
@@ -18,20 +31,87 @@ os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
 PATHS = {
     "YOLO": "models/fire_model.pt",
     "FFIRENET": "models/mobilenetv2_fire_detection.h5",
+    # ONNX exports of the same models (python export_models.py)
+    "YOLO_ONNX": "models/fire_model.onnx",
+    "FFIRENET_ONNX": "models/mobilenetv2_fire_detection.onnx",
+    "MIDAS_ONNX": "models/midas_small.onnx",
+    # Traced MiDaS for MODEL_OFFLINE=1 (no torch.hub / GitHub at startup)
+    "MIDAS_TORCHSCRIPT": "models/midas_small.torchscript.pt",
+    # INT8 variants of the ONNX exports (python quantize_models.py)
+    "YOLO_INT8": "models/fire_model.int8.onnx",
+    "FFIRENET_INT8": "models/mobilenetv2_fire_detection.int8.onnx",
+    "MIDAS_INT8": "models/midas_small.int8.onnx",
 }
 
+# Load everything from PATHS only: no hub downloads, no update checks
+MODEL_OFFLINE = os.getenv("MODEL_OFFLINE", "0") == "1"
+if MODEL_OFFLINE:
+    os.environ.setdefault("YOLO_OFFLINE", "1")
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+# Seconds to give Orion/Camera Service before monitoring starts (model loading counts towards it)
+STARTUP_DELAY = float(os.getenv("STARTUP_DELAY", "5"))
+
+# "native" = ultralytics / Keras / torch.hub, "onnx" = ONNX Runtime for all three
+# Per-model override: YOLO_BACKEND, FFIRENET_BACKEND, MIDAS_BACKEND
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "native")
+BACKENDS = {
+    "YOLO": os.getenv("YOLO_BACKEND", INFERENCE_BACKEND),
+    "FFIRENET": os.getenv("FFIRENET_BACKEND", INFERENCE_BACKEND),
+    "MIDAS": os.getenv("MIDAS_BACKEND", INFERENCE_BACKEND),
+}
+# Use the INT8 models for every model on the onnx backend
+QUANTIZED_MODELS = os.getenv("QUANTIZED_MODELS", "0") == "1"
+
 PARAMS = {
     "YOLO_CONF": 0.4,
     "FFIRENET_CONF": 0.5,
-    "FAKE_CALIBRATION_C": 5000.0
+    "FAKE_CALIBRATION_C": 5000.0,
+    "BATCH_MAX_SIZE": 8,     # Max frames per YOLO forward pass
+    "BATCH_MAX_WAIT": 0.5,   # Seconds to wait for more cameras after the first frame
+    "POLL_INTERVAL": 0.5,    # Pause between monitoring cycles
+    "DEPTH_MODE": "full",    # "full" = whole frame (cached per camera), "roi" = only around the detections
+    "DEPTH_CACHE_TTL": 300.0,         # Seconds a cached depth map stays valid (0 disables the cache)
+    "DEPTH_CACHE_MAX_CHANGE": 0.2,    # Thumbnail change that invalidates a cached map
+    "DEPTH_ROI_MARGIN": 0.5,          # ROI mode: padding around the detections, relative to their size
+    "DEPTH_ROI_MIN_SIZE": 256,        # ROI mode: smallest crop side in pixels
+    "ALERT_HEARTBEAT": 60.0, # Re-publish an unchanged alert at most this often (seconds)
+    "TEMPORAL_CONFIRM": True, # Confirm fires over several frames per camera (fire_tracker.py) instead of one
+    "PARALLEL_STARTUP": True, # Load and warm up the three models concurrently
+    "ROI_TILING": True        # Cameras with a <camera>_roi.json only run YOLO on tiles of those regions (roi_tiler.py)
 }
 
 ORION_URL = "http://150.140.186.118:1026/v2/entities"
 FIWARE_SERVICE_PATH = "/2025_team2"
+ORION_UPDATE_URL = "http://150.140.186.118:1026/v2/op/update"
+
+# Per-camera ROI polygons, next to FireAdmin's <camera>_config.json calibration files
+ROI_CONFIG_DIR = os.getenv("ROI_CONFIG_DIR", "../FireAdmin/public/configs")
 
 # CAMERA_SERVICE_URL = "https://camerascreenshots.fireproject.sveronis.net/screenshot/"
 CAMERA_SERVICE_URL = "https://camerascreenshots.fireproject.sveronis.net/screenshot/"
 
+# Frame ingest: "http" = Camera Service screenshots, "rtsp" = in-process stream grabbers,
+# "shm" = raw frames from a Camera Service on the same host via shared memory (frame_ring.py), HTTP as fallback
+INGEST_MODE = os.getenv("INGEST_MODE", "http")
+FRAME_RING = os.getenv("FRAME_RING", "fire_frames")
+# Optional stand-in for the Orion Camera registry, e.g. "cam1=/data/fire.mp4,cam2=rtsp://127.0.0.1:8554/test"
+INGEST_SOURCES = os.getenv("INGEST_SOURCES", "")
+# "sequential" = one fetch/detect/publish loop, "staged" = concurrent asyncio stages (staged_pipeline.py)
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "sequential")
+# >1 starts a supervisor with that many engine processes, cameras sharded by consistent hash (supervisor.py)
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "1"))
+
+grabber_pool = None
+frame_ring = None
+camera_shard = None     # {camera_id: (source, camera_meta)} when running as a supervisor worker
+shard_cursor = 0
+fetch_pool = None       # Camera Service requests of the sequential loop (HTTP ingest)
+pending_fetches = {}    # future -> camera_id (None for the service's own round robin)
+scene_gate = SceneChangeGate()
+scheduler = None        # PollScheduler, created in start_monitoring
+publisher = AlertPublisher(ORION_UPDATE_URL, FIWARE_SERVICE_PATH, heartbeat=PARAMS["ALERT_HEARTBEAT"])
+
 # app = Flask(__name__)
 
 def send_to_fiware(alert_data):
@@ -75,93 +155,128 @@ def send_to_fiware(alert_data):
         return False
 
 def calculate_new_coords(lat, lon, distance_meters, bearing_degrees):
-
-    R = 6378137  # Earth Radius in meters
-    
-    # Convert to radians
-    lat_rad = math.radians(lat)
-    lon_rad = math.radians(lon)
-    bearing_rad = math.radians(bearing_degrees)
-    
-    # Calculate offset
-    dn = distance_meters * math.cos(bearing_rad)
-    de = distance_meters * math.sin(bearing_rad)
-    
-    # Coordinate offsets in radians
-    dLat = dn / R
-    dLon = de / (R * math.cos(lat_rad))
-    
-    # New coordinates in degrees
-    new_lat = lat + math.degrees(dLat)
-    new_lon = lon + math.degrees(dLon)
-    
-    return [new_lon, new_lat] # FIWARE uses [Lng, Lat] order
+    # Scalar form of geometry.project, kept for callers outside the engine
+    return project(lon, lat, distance_meters, bearing_degrees).tolist() # FIWARE uses [Lng, Lat] order
 
 class FireDetectionEngine:
-    def __init__(self):
+    def __init__(self, backends=None, offline=None, quantized=None):
         print("Initializing AI Engine...")
-        self.device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
-        print(f"Hardware Acceleration: {self.device}")
+        started = time.perf_counter()
+        backends = {**BACKENDS, **(backends or {})}
+        offline = MODEL_OFFLINE if offline is None else offline
+        quantized = QUANTIZED_MODELS if quantized is None else quantized
+        print(f"Inference backends: {backends} ({INFERENCE_THREADS} threads{', offline' if offline else ''}{', int8' if quantized else ''})")
+        if quantized and "native" in backends.values():
+            print("Warning: INT8 variants only exist for the onnx backend, native models stay FP32")
+
+        self.target_classes = [0, 1] # Fire/Smoke classes
+        self.ffirenet = None
+        self.midas = None
+        self._ff_buffer = None
+        self.startup_timings = {}
+
+        # Frameworks are imported inside each loader, only for the models that are enabled
+        loaders = {
+            "YOLO": lambda: load_detector(backends["YOLO"], PATHS, self.target_classes, quantized),
+            "MIDAS": lambda: load_depth(backends["MIDAS"], PATHS, offline, quantized),
+        }
+        ff_path = model_path(PATHS, "FFIRENET", backends["FFIRENET"], quantized)
+        if not os.path.exists(ff_path): 
+            # Optional warning instead of crash if you only use YOLO
+            print("Warning: FFireNet model missing") 
+        else:
+            loaders["FFIRENET"] = lambda: load_classifier(backends["FFIRENET"], PATHS, quantized)
 
-        # A. Load YOLO
+        workers = len(loaders) if PARAMS["PARALLEL_STARTUP"] else 1
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="model-load") as pool:
+            futures = {name: pool.submit(self._load_model, name, loader) for name, loader in loaders.items()}
+
+        # A. YOLO
         try:
-            self.yolo = YOLO(PATHS["YOLO"])
-            self.target_classes = [0, 1] # Fire/Smoke classes
+            self.yolo = futures["YOLO"].result()
             print("YOLOv8 Loaded")
         except Exception as e:
             raise RuntimeError(f"Critical: Failed to load YOLO ({e})")
 
-        # B. Load FFireNet (Keras)
-        try:
-            if not os.path.exists(PATHS["FFIRENET"]): 
-                # Optional warning instead of crash if you only use YOLO
-                print("Warning: FFireNet model missing") 
-            else:
-                self.ffirenet = tf.keras.models.load_model(PATHS["FFIRENET"])
-                self.ffirenet.predict(np.zeros((1, 224, 224, 3), dtype=np.float32), verbose=0)
+        # B. FFireNet
+        if "FFIRENET" in futures:
+            try:
+                self.ffirenet = futures["FFIRENET"].result()
                 print("FFireNet Loaded")
-        except Exception as e:
-            print(f"Warning: Failed to load FFireNet ({e})")
+            except Exception as e:
+                print(f"Warning: Failed to load FFireNet ({e})")
 
-        # C. Load MiDaS (Depth)
+        # C. MiDaS (Depth)
         try:
-            self.midas = torch.hub.load("intel-isl/MiDaS", "MiDaS_small")
-            self.midas.to(self.device).eval()
-            self.transforms = torch.hub.load("intel-isl/MiDaS", "transforms").small_transform
+            self.midas = futures["MIDAS"].result()
             print("MiDaS Depth Loaded")
         except Exception as e:
             print(f"Warning: Depth model failed ({e}). Distance will be null.")
             self.midas = None
 
-        print("AI Engine Ready.\n")
+        self.startup_timings["total_s"] = round(time.perf_counter() - started, 2)
+        for name, t in self.startup_timings.items():
+            if isinstance(t, dict):
+                print(f"  {name:<9} load {t['load_s']:>6.2f}s  warm-up {t['warmup_s']:>6.2f}s")
+        print(f"  {'total':<9} {self.startup_timings['total_s']:.2f}s")
+        self.depth_cache = DepthCache(PARAMS["DEPTH_CACHE_TTL"], PARAMS["DEPTH_CACHE_MAX_CHANGE"])
 
-    def _preprocess_ffirenet(self, crop):
-        rgb = cv2.cvtColor(crop, cv2.COLOR_BGR2RGB)
-        resized = cv2.resize(rgb, (224, 224))
-        normalized = resized.astype(np.float32) / 255.0
-        return np.expand_dims(normalized, axis=0)
-
-    def _calculate_distance(self, depth_map, bbox, calib_val=1.0):
-        if depth_map is None: return None
-        x1, y1, x2, y2 = map(int, bbox)
-        h, w = depth_map.shape
-        x1, y1 = max(0, x1), max(0, y1)
-        x2, y2 = min(w, x2), min(h, y2)
-        
-        region = depth_map[y1:y2, x1:x2]
-        if region.size == 0: return None
-        
-        median_raw = np.median(region)
-        if median_raw < 0.001: return 999.9
-        if calib_val < 0.1: calib_val = PARAMS["FAKE_CALIBRATION_C"] 
-        return round(calib_val/ median_raw, 2)
+        self.tracker = FireTracker(PARAMS["FFIRENET_CONF"]) if PARAMS["TEMPORAL_CONFIRM"] else None
+        self.roi = RoiTiler(ROI_CONFIG_DIR) if PARAMS["ROI_TILING"] else None
+        self.candidate_counts = {}   # source_id -> YOLO candidates in its last frame (poll_scheduler.py)
+        self.poses = PoseCache()
+
+        # Per-stage timings, only collected when a caller (e.g. benchmark.py) sets this to {}
+        self.timings = None
 
-    def _format_fiware_alert(self, source_id, is_fire, distance=None, confidence=None, fire_coords=None):
+        print("AI Engine Ready.\n")
+
+    def _load_model(self, name, loader):
+        started = time.perf_counter()
+        model = loader()
+        loaded = time.perf_counter()
+        model.warmup()
+        self.startup_timings[name] = {
+            "load_s": round(loaded - started, 2),
+            "warmup_s": round(time.perf_counter() - loaded, 2)
+        }
+        return model
+
+    @contextmanager
+    def _timed(self, stage):
+        if self.timings is None:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings.setdefault(stage, []).append(time.perf_counter() - started)
+
+    def _preprocess_ffirenet_batch(self, crops):
+        # All crops go into one preallocated (N,224,224,3) buffer -> single predict call
+        n = len(crops)
+        if self._ff_buffer is None or self._ff_buffer.shape[0] < n:
+            self._ff_buffer = np.empty((max(n, 8), 224, 224, 3), dtype=np.float32)
+        batch = self._ff_buffer[:n]
+        for i, crop in enumerate(crops):
+            resized = cv2.resize(crop, (224, 224))
+            # BGR -> RGB via reversed channel view, normalized straight into the buffer
+            np.divide(resized[..., ::-1], np.float32(255.0), out=batch[i])
+        return batch
+
+    def _format_fiware_alert(self, source_id, is_fire, **kwargs):
+        with self._timed("alert"):
+            return self._build_fiware_alert(source_id, is_fire, **kwargs)
+
+    def _build_fiware_alert(self, source_id, is_fire, distance=None, confidence=None, fire_coords=None, fires=None):
         current_time = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
         safe_id = source_id.split(":")[-1] if ":" in source_id else source_id 
 
         if is_fire:
             safe_description = f"Fire detected at {distance}m - Confidence {confidence:.2f}"
+            if fires and len(fires) > 1:
+                safe_description += f" (+{len(fires) - 1} more)"
             
             alert = {
                 "id": f"urn:ngsi-ld:Alert:Fire:{safe_id}",
@@ -182,6 +297,10 @@ class FireDetectionEngine:
                         "coordinates": fire_coords # [Lng, Lat]
                     }
                 }
+
+            # Every confirmed fire in the frame, strongest first
+            if fires:
+                alert["fires"] = { "value": fires, "type": "StructuredValue" }
             return alert
         else:
             return {
@@ -192,149 +311,466 @@ class FireDetectionEngine:
                 "description": { "value": "System Normal", "type": "Text" },
                 "dateIssued": { "value": current_time, "type": "DateTime" },
                 "severity": { "value": "info", "type": "Text" },
-                "validFrom": { "value": current_time, "type": "DateTime" }
+                "validFrom": { "value": current_time, "type": "DateTime" },
+                # No fires; the publisher's replace also drops the last fire's location
+                "fires": { "value": [], "type": "StructuredValue" }
             }
 
-    def process_frame(self, frame, source_id="camera_stream", camera_meta=None):
+    def _detect_batch(self, frames):
+        # One YOLO forward pass for every frame in the batch
+        with self._timed("yolo"):
+            return self.yolo.detect(frames, conf=PARAMS["YOLO_CONF"])
+
+    def _detect_candidates(self, frames, source_ids):
         """
-        Modified to accept an OpenCV frame and Camera Metadata.
+        YOLO boxes per frame in full-frame coordinates.
+        Frames of cameras with ROI polygons are replaced by their tiles, and all
+        whole frames and tiles go through YOLO together in TILE_BATCH sized passes.
+        """
+        inputs, owners = [], []      # owners[i] = (frame index, tile offset or None)
+        tiled = []
+        for i, (frame, source_id) in enumerate(zip(frames, source_ids)):
+            tiles = self.roi.tiles(source_id, frame) if self.roi is not None else None
+            if tiles is None:
+                inputs.append(frame)
+                owners.append((i, None))
+                continue
+            tiled.append(i)
+            for x1, y1, x2, y2 in tiles:
+                inputs.append(frame[y1:y2, x1:x2])
+                owners.append((i, (x1, y1)))
+
+        if not tiled:
+            return self._detect_batch(inputs)
+
+        step = max(1, ROI_PARAMS["TILE_BATCH"])
+        detections = []
+        for start in range(0, len(inputs), step):
+            detections += self._detect_batch(inputs[start:start + step])
+
+        candidates = [[] for _ in frames]
+        for (i, offset), boxes in zip(owners, detections):
+            if offset is None:
+                candidates[i] = boxes
+                continue
+            ox, oy = offset
+            candidates[i] += [[x1 + ox, y1 + oy, x2 + ox, y2 + oy] for x1, y1, x2, y2 in boxes]
+
+        for i in tiled:
+            candidates[i] = self.roi.keep(source_ids[i], frames[i], candidates[i])
+        return candidates
+
+    def _estimate_depth(self, frame):
+        with self._timed("midas"):
+            return self.midas.estimate(frame)
+
+    def _depth_roi(self, frame, boxes):
+        # Union of the detections, padded so MiDaS still sees some context around the fire
+        h, w = frame.shape[:2]
+        x1 = min(b[0] for b in boxes); y1 = min(b[1] for b in boxes)
+        x2 = max(b[2] for b in boxes); y2 = max(b[3] for b in boxes)
+        cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+        half_w = max((x2 - x1) * (1 + 2 * PARAMS["DEPTH_ROI_MARGIN"]), PARAMS["DEPTH_ROI_MIN_SIZE"]) / 2
+        half_h = max((y2 - y1) * (1 + 2 * PARAMS["DEPTH_ROI_MARGIN"]), PARAMS["DEPTH_ROI_MIN_SIZE"]) / 2
+        return (
+            max(0, int(cx - half_w)), max(0, int(cy - half_h)),
+            min(w, int(cx + half_w)), min(h, int(cy + half_h))
+        )
+
+    def _depth_for(self, frame, source_id, boxes):
         """
-        # A. YOLO Detection
-        results = self.yolo.predict(frame, conf=PARAMS["YOLO_CONF"], verbose=False)[0]
-        candidates = [box.xyxy[0].tolist() for box in results.boxes if int(box.cls[0]) in self.target_classes]
+        Returns (depth_map, offset) where offset is the frame position of depth_map[0, 0].
+        Note: calibration constants were measured on full-frame depth, so ROI
+        distances are approximate; use ROI mode when alert latency matters more.
+        """
+        if PARAMS["DEPTH_MODE"] == "roi":
+            x1, y1, x2, y2 = self._depth_roi(frame, boxes)
+            return self._estimate_depth(frame[y1:y2, x1:x2]), (x1, y1)
+
+        if PARAMS["DEPTH_CACHE_TTL"] <= 0:
+            return self._estimate_depth(frame), (0, 0)
+
+        depth_map = self.depth_cache.get(source_id, frame)
+        if depth_map is None:
+            depth_map = self._estimate_depth(frame)
+            self.depth_cache.put(source_id, frame, depth_map)
+        return depth_map, (0, 0)
+
+    def _verify_candidates(self, frame, candidates, source_id, camera_meta):
+        self.candidate_counts[source_id] = len(candidates)
+        # Location, bearing and calibration parsed once per camera
+        pose = self.poses.get(source_id, camera_meta)
+
+        # B. Crop every candidate
+        h, w = frame.shape[:2]
+        boxes, crops = [], []
+        for bbox in candidates:
+            x1, y1, x2, y2 = map(int, bbox)
+            x1, y1 = max(0, x1), max(0, y1)
+            x2, y2 = min(w, x2), min(h, y2)
+            crop = frame[y1:y2, x1:x2]
+            if crop.size == 0: continue
+            boxes.append(bbox)
+            crops.append(crop)
+
+        # Temporal tracks decide which crops still need the verifier (all of them without a tracker)
+        matches = self.tracker.associate(source_id, boxes) if self.tracker is not None else None
+        to_verify = [i for i in range(len(crops)) if matches is None or matches[i][1]]
+
+        # C. FFireNet Check (all crops that need it in one forward pass)
+        scores = {}
+        if to_verify:
+            if self.ffirenet is not None:
+                with self._timed("ffirenet"):
+                    ff_input = self._preprocess_ffirenet_batch([crops[i] for i in to_verify])
+                    scores = dict(zip(to_verify, map(float, self.ffirenet.predict(ff_input))))
+            else:
+                scores = {i: 0.6 for i in to_verify} # Fallback if FFireNet missing, trust YOLO
 
-        fire_found = False
-        final_alert = None
-        
-        calib_val = 0
-        if camera_meta:
-             calib_val = float(camera_meta.get("calibrationConstant", {}).get("value", 1.0))
-        
-        # B. Verification Loop
-        if candidates:
-            depth_map = None
-            h, w = frame.shape[:2]
-            
-            for bbox in candidates:
-                x1, y1, x2, y2 = map(int, bbox)
-                x1, y1 = max(0, x1), max(0, y1)
-                x2, y2 = min(w, x2), min(h, y2)
-                crop = frame[y1:y2, x1:x2]
-                if crop.size == 0: continue
-
-                # FFireNet Check
-                score = 0.0
-                if hasattr(self, 'ffirenet'):
-                    ff_input = self._preprocess_ffirenet(crop)
-                    score = self.ffirenet.predict(ff_input, verbose=0)[0][0]
-                else:
-                    score = 0.6 # Fallback if FFireNet missing, trust YOLO
-
-                if score > PARAMS["FFIRENET_CONF"]:
-                    fire_found = True
-                    
-                    # Compute Depth (MiDaS) - FIXED LOGIC
-                    if self.midas and depth_map is None:
-                        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                        input_batch = self.transforms(rgb).to(self.device)
-                        with torch.no_grad():
-                            prediction = self.midas(input_batch)
-                            prediction = torch.nn.functional.interpolate(
-                                prediction.unsqueeze(1),
-                                size=frame.shape[:2],
-                                mode="bicubic",
-                                align_corners=False,
-                            ).squeeze()
-                        depth_map = prediction.cpu().numpy()
-
-                    dist = self._calculate_distance(depth_map, bbox,calib_val)
-                    
-                    # Calculate Fire Coordinates using Metadata
-                    fire_loc = None
-                    if dist and camera_meta:
-                        try:
-                            # Safe extraction: check if keys exist
-                            loc_val = camera_meta.get('location', {}).get('value', {})
-                            if 'coordinates' in loc_val:
-                                cam_lng, cam_lat = loc_val['coordinates'] # GeoJSON is [Lng, Lat]
-                                
-                                # Angle might be a Number or Text, handle both
-                                cam_angle = 0
-                                if 'rotationAngle' in camera_meta:
-                                    cam_angle = float(camera_meta['rotationAngle'].get('value', 0))
-
-                                # Calculate Fire Location
-                                fire_loc = calculate_new_coords(cam_lat, cam_lng, dist, cam_angle)
-                        except Exception as e:
-                            print(f"Location calc failed: {e}")
-
-                    # Create Alert with Location
-                    final_alert = self._format_fiware_alert(source_id, is_fire=True, distance=dist, confidence=score, fire_coords=fire_loc)
-                    break
-
-        if not fire_found:
-            final_alert = self._format_fiware_alert(source_id, is_fire=False)
-
-        return final_alert
-
-
-engine = FireDetectionEngine()
+        if matches is None:
+            confirmed = [(scores[i], boxes[i], None) for i in to_verify if scores[i] > PARAMS["FFIRENET_CONF"]]
+        else:
+            confirmed = []
+            for i, (track, _) in enumerate(matches):
+                self.tracker.update(track, scores.get(i))
+                if self.tracker.is_confirmed(track):
+                    confirmed.append((track.score, boxes[i], track.id))
+
+        if not confirmed:
+            return self._format_fiware_alert(source_id, is_fire=False)
+        confirmed.sort(key=lambda item: item[0], reverse=True)
+
+        # D. Depth (MiDaS) at most once per frame, shared by every confirmed fire
+        depth_map, offset = None, (0, 0)
+        if self.midas:
+            depth_map, offset = self._depth_for(frame, source_id, [bbox for _, bbox, _ in confirmed])
+
+        # E. Distances and geo-projection for every confirmed fire in one go
+        bboxes = [bbox for _, bbox, _ in confirmed]
+        if depth_map is not None:
+            dists = distances(box_medians(depth_map, bboxes, offset), pose.calibration, PARAMS["FAKE_CALIBRATION_C"])
+        else:
+            dists = np.full(len(bboxes), np.nan)
+        coords = pose.locate(dists)
+
+        fires = []
+        for (score, bbox, track_id), dist, location in zip(confirmed, dists, coords):
+            fires.append({
+                "track": track_id,
+                "confidence": round(score, 4),
+                "distance": float(dist) if np.isfinite(dist) else None,
+                "bbox": [round(v, 1) for v in bbox],
+                "coordinates": location # [Lng, Lat] or None
+            })
+
+        # Top-level fields describe the strongest fire, "fires" lists all of them
+        best = fires[0]
+        return self._format_fiware_alert(source_id, is_fire=True, distance=best["distance"], confidence=best["confidence"], fire_coords=best["coordinates"], fires=fires)
+
+    def process_frames(self, batch):
+        """
+        Batched version of process_frame.
+        batch: list of (frame, source_id, camera_meta) tuples, one per camera.
+        Returns one alert per entry, in the same order.
+        """
+        alerts = []
+        max_size = max(1, int(PARAMS["BATCH_MAX_SIZE"]))
 
-def process_camera():
+        for start in range(0, len(batch), max_size):
+            chunk = batch[start:start + max_size]
+
+            # A. YOLO Detection (whole chunk in one pass, ROI tiles included)
+            detections = self._detect_candidates([frame for frame, _, _ in chunk], [source_id for _, source_id, _ in chunk])
+
+            for (frame, source_id, camera_meta), candidates in zip(chunk, detections):
+                alerts.append(self._verify_candidates(frame, candidates, source_id, camera_meta))
+
+        return alerts
+
+    def process_frame(self, frame, source_id="camera_stream", camera_meta=None):
+        """
+        Modified to accept an OpenCV frame and Camera Metadata.
+        """
+        return self.process_frames([(frame, source_id, camera_meta)])[0]
+
+
+engine = None
+
+def set_camera_shard(registry):
+    """
+    Restricts this process to a subset of the cameras (supervisor worker mode).
+    Safe to call from another thread: the grabber pool resyncs on its own thread.
+    """
+    global camera_shard
+    camera_shard = dict(registry)
+    if grabber_pool is not None:
+        grabber_pool.request_sync()
+
+
+def next_camera_url(exclude=()):
+    """(url, camera_meta, camera_id) of the next camera to fetch, skipping exclude; (None, None, None) when there is none."""
+    global shard_cursor
+    if scheduler is not None:
+        # Risk-adaptive order over the per-id endpoint (our shard only, via load_camera_registry)
+        camera_id = scheduler.next(exclude)
+        if camera_id is None: return None, None, None
+        return CAMERA_SERVICE_URL + quote(camera_id, safe=""), scheduler.registry.get(camera_id), camera_id
+
+    if camera_shard is None:
+        return CAMERA_SERVICE_URL, None, None
+
+    # Sharded: walk our own cameras through the per-id endpoint
+    ids = sorted(camera_shard)
+    for _ in range(len(ids)):
+        camera_id = ids[shard_cursor % len(ids)]
+        shard_cursor += 1
+        if camera_id not in exclude:
+            return CAMERA_SERVICE_URL + quote(camera_id, safe=""), camera_shard[camera_id][1], camera_id
+    return None, None, None
+
+
+def fetch_camera_payload(target=None):
+    """
+    Asks the Camera Service for the next screenshot (round robin), or for
+    target, a next_camera_url() result picked by the caller.
+    Returns the JSON payload or None.
+    """
     try:
+        url, shard_meta, _ = target or next_camera_url()
+        if url is None: return None
+
         # Increase timeout in case ffmpeg or network is slow
-        res = requests.get(CAMERA_SERVICE_URL, timeout=30)
+        res = requests.get(url, timeout=30)
         
         if res.status_code == 200:
             data = res.json()
-            camera_id = data.get("id", "unknown")
             
             if "img" in data and data["img"]:
-                
-                
-                camera_met = {
-                    "location": data.get("location", {}),
-                    "rotationAngle": data.get("rotationAngle", {}),
-                    "calibrationConstant": data.get("calibrationConstant", {})
-                }
-
-                # Decode Image
-                img_bytes = base64.b64decode(data["img"])
-                np_arr = np.frombuffer(img_bytes, np.uint8)
-                frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-
-                # print(f" Analyzing {camera_id}...", end="\r")
-                alert = engine.process_frame(frame, source_id=camera_id, camera_meta=camera_met)
-
-                # if alert["severity"]["value"] == "critical":
-                #     print(f"\n FIRE DETECTED in {camera_id}! Sending Alert...")
-                #     # send_to_fiware(alert)
-                #     # print(json.dumps(alert, indent=2)) 
-                # else:
-                #     pass
-                
-                send_to_fiware(alert)
-                # print(json.dumps(alert, indent=2))
+                # The per-id endpoint only returns the image, metadata comes from the registry
+                if shard_meta:
+                    for key, value in shard_meta.items():
+                        if data.get(key) is None: data[key] = value
+                return data
             else:
-                print(f"Camera {camera_id} returned no image data.")
+                print(f"Camera {data.get('id', 'unknown')} returned no image data.")
         else:
             print(f"Could not reach Camera Service (Status {res.status_code})")
 
+    except Exception as e:
+        print(f"Error fetching camera frame: {e}")
+
+    return None
+
+
+def decode_camera_payload(data):
+    """
+    Camera Service payload -> (frame, camera_id, camera_meta) or None.
+    """
+    camera_id = data.get("id", "unknown")
+    camera_met = {
+        "location": data.get("location") or {},
+        "rotationAngle": data.get("rotationAngle") or {},
+        "calibrationConstant": data.get("calibrationConstant") or {}
+    }
+
+    # Decode Image
+    img_bytes = base64.b64decode(data["img"])
+    np_arr = np.frombuffer(img_bytes, np.uint8)
+    frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+    if frame is None:
+        print(f"Camera {camera_id} returned an undecodable image.")
+        return None
+
+    return frame, camera_id, camera_met
+
+
+def fetch_camera_frame(target=None):
+    """
+    Grabs the next frame (or target's) from the Camera Service (round robin).
+    Returns (frame, camera_id, camera_meta) or None.
+    """
+    data = fetch_camera_payload(target)
+    if data is None: return None
+    try:
+        return decode_camera_payload(data)
+    except Exception as e:
+        print(f"Error decoding camera frame: {e}")
+        return None
+
+
+def start_fetches():
+    # Keeps up to FETCH_CONCURRENCY screenshot requests in flight, never two for the same camera
+    global fetch_pool
+    if fetch_pool is None:
+        fetch_pool = ThreadPoolExecutor(max_workers=STAGE_PARAMS["FETCH_CONCURRENCY"], thread_name_prefix="fetch")
+    while len(pending_fetches) < STAGE_PARAMS["FETCH_CONCURRENCY"]:
+        target = next_camera_url(exclude={cid for cid in pending_fetches.values() if cid is not None})
+        if target[0] is None: break
+        pending_fetches[fetch_pool.submit(fetch_camera_frame, target)] = target[2]
+
+
+def collect_batch():
+    """
+    Collects frames until BATCH_MAX_SIZE cameras are in hand or BATCH_MAX_WAIT
+    seconds have passed since the first frame arrived, so a lone camera is
+    never held back longer than the deadline. Screenshots are fetched in the
+    background: a fetch still running at the deadline is not waited for, its
+    frame goes into the next batch.
+    """
+    if grabber_pool is not None:
+        return collect_grabber_batch()
+    if frame_ring is not None and frame_ring.heartbeat_age() < GRABBER_PARAMS["STALE_AFTER"]:
+        return collect_grabber_batch(frame_ring)
+
+    start_fetches()
+    batch = {}
+    deadline = None
+
+    while pending_fetches and len(batch) < PARAMS["BATCH_MAX_SIZE"]:
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        done, _ = wait(list(pending_fetches), timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            del pending_fetches[future]
+            item = future.result()      # fetch_camera_frame reports its own errors
+            if item is None: continue
+            # Keep only the newest frame per camera -> one alert per camera
+            batch[item[1]] = item
+            if deadline is None:
+                deadline = time.monotonic() + PARAMS["BATCH_MAX_WAIT"]
+
+        if deadline is not None and time.monotonic() >= deadline:
+            break
+
+    return list(batch.values())
+
+
+def collect_grabber_batch(source=None):
+    # Grabbers (and the frame ring) always hold the newest frame, so only wait for cameras that have not delivered yet
+    source = source or grabber_pool
+    max_size = PARAMS["BATCH_MAX_SIZE"]
+    # Frames are free here, so the scheduler only holds back hot cameras inside their rate cap
+    held_back = scheduler.held_back() if scheduler is not None else set()
+    batch = source.next_batch(max_size, exclude=held_back)
+    if not batch: return []
+
+    deadline = time.monotonic() + PARAMS["BATCH_MAX_WAIT"]
+    while len(batch) < max_size and time.monotonic() < deadline:
+        time.sleep(0.02)
+        seen = {camera_id for _, camera_id, _ in batch}
+        batch.extend(source.next_batch(max_size - len(batch), exclude=seen | held_back))
+
+    if scheduler is not None:
+        for _, camera_id, _ in batch: scheduler.record_sample(camera_id)
+    return batch
+
+
+def load_camera_registry():
+    if camera_shard is not None:
+        return dict(camera_shard)
+    if INGEST_SOURCES:
+        return parse_static_sources(INGEST_SOURCES)
+    return fetch_camera_registry(ORION_URL, FIWARE_SERVICE_PATH)
+
+
+def process_camera():
+    """One monitoring cycle; returns how many cameras were served."""
+    try:
+        batch = collect_batch()
+        if not batch: return 0
+
+        # Only cameras whose scene changed (or are due a forced pass) hit the engine
+        to_run = [item for item in batch if scene_gate.needs_inference(item[1], item[0])]
+
+        if to_run:
+            # print(f" Analyzing {[cam_id for _, cam_id, _ in to_run]}...", end="\r")
+            started = time.perf_counter()
+            results = engine.process_frames(to_run)
+            per_frame = (time.perf_counter() - started) / len(to_run)
+            for (_, camera_id, _), alert in zip(to_run, results):
+                scene_gate.record(camera_id, alert, per_frame)
+                if scheduler is not None:
+                    scheduler.observe(camera_id, alert, engine.candidate_counts.get(camera_id, 0))
+
+        alerts = [scene_gate.cached_alert(camera_id) for _, camera_id, _ in batch]
+        scene_gate.report()
+        if scheduler is not None: scheduler.report()
+
+        # if alert["severity"]["value"] == "critical":
+        #     print(f"\n FIRE DETECTED in {camera_id}! Sending Alert...")
+        #     # send_to_fiware(alert)
+        #     # print(json.dumps(alert, indent=2)) 
+        # else:
+        #     pass
+
+        # Only severity changes and heartbeats reach Orion, all in one batch update
+        for alert in alerts:
+            if alert is None: continue
+            publisher.submit(alert)
+            # print(json.dumps(alert, indent=2))
+        publisher.flush()
+        return len(batch)
+
     except Exception as e:
         print(f"Error processing camera: {e}")
+        return 0
         
         
+def open_frame_ring():
+    # Supervisor workers only take the cameras of their shard
+    accept = (lambda camera_id: camera_id in camera_shard) if camera_shard is not None else None
+    try:
+        ring = FrameRingReader(FRAME_RING, accept=accept)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Frame ring {FRAME_RING} unavailable ({e}), using the Camera Service over HTTP")
+        return None
+    print(f"Reading frames from shared memory /dev/shm/{FRAME_RING} ({ring.slots} slots), HTTP fallback when it goes stale")
+    return ring
+
+
 def start_monitoring():
+    global grabber_pool, frame_ring, scheduler
 
     print("AI Pipeline started")
-    print(f"Connecting to Camera Service at: {CAMERA_SERVICE_URL}")
+    if SCHED_PARAMS["ENABLED"]:
+        scheduler = PollScheduler(load_camera_registry, ORION_URL, FIWARE_SERVICE_PATH)
+        scheduler.refresh()     # first read blocks here, later ones run in the background
+        print(f"Risk-adaptive polling: every camera at least every {SCHED_PARAMS['MAX_REVISIT']}s, at most every {SCHED_PARAMS['MIN_INTERVAL']}s")
+    if INGEST_MODE == "rtsp":
+        grabber_pool = GrabberPool(load_camera_registry)
+        grabber_pool.sync()
+        print(f"Streaming {len(grabber_pool.grabbers)} cameras in-process")
+    else:
+        if INGEST_MODE == "shm":
+            frame_ring = open_frame_ring()
+        print(f"Connecting to Camera Service at: {CAMERA_SERVICE_URL}")
     print(f"Connecting to FIWARE at: {ORION_URL}")
+    print(f"Batching up to {PARAMS['BATCH_MAX_SIZE']} cameras (max wait {PARAMS['BATCH_MAX_WAIT']}s)")
+
+    if PIPELINE_MODE == "staged":
+        pipeline = StagedPipeline(
+            engine, scene_gate, publisher, PARAMS,
+            fetch_payload=fetch_camera_payload,
+            next_target=next_camera_url,
+            decode_payload=decode_camera_payload,
+            grabber_pool=grabber_pool or frame_ring,
+            scheduler=scheduler
+        )
+        asyncio.run(pipeline.run())
+        return
 
     while True:
-        process_camera()
-        time.sleep(0.5) 
+        served = process_camera()
+        # With the scheduler, go straight on while cameras are waiting; the full pause only when nothing came in
+        time.sleep(scheduler.idle_time(PARAMS["POLL_INTERVAL"]) if scheduler is not None and served else PARAMS["POLL_INTERVAL"])
 
 if __name__ == "__main__":
-    # Wait a moment for other services (Orion/Camera) to wake up
-    time.sleep(5)
-    start_monitoring()
\ No newline at end of file
+    boot = time.monotonic()
+    if PIPELINE_WORKERS > 1:
+        time.sleep(STARTUP_DELAY)
+        from supervisor import run_supervisor
+        run_supervisor(PIPELINE_WORKERS, load_camera_registry, PATHS, BACKENDS)
+    else:
+        engine = FireDetectionEngine()
+        # Wait a moment for other services (Orion/Camera) to wake up, minus the time spent loading models
+        time.sleep(max(0.0, STARTUP_DELAY - (time.monotonic() - boot)))
+        start_monitoring()
@@ -0,0 +1,97 @@
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class AlertPublisher:
+    """
+    Per-camera alert state machine in front of Orion.
+    An alert is only written when its severity differs from the last one
+    published for that entity, or when the heartbeat interval has passed.
+    Everything pending is sent in one /v2/op/update call per flush (append),
+    plus one "replace" call for entities going back to normal so the last
+    fire's attributes do not stay on them.
+    """
+
+    def __init__(self, update_url, service_path, heartbeat=60.0, max_entities=100):
+        self.update_url = update_url
+        self.heartbeat = heartbeat
+        self.max_entities = max_entities
+
+        # One pooled keep-alive connection instead of a new socket per alert
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Fiware-ServicePath": service_path
+        })
+
+        self.severity = {}    # entity_id -> last published severity
+        self.last_sent = {}   # entity_id -> monotonic time of last publish
+        self.pending = {}     # entity_id -> newest alert waiting for flush
+
+        self.submitted = 0
+        self.published = 0
+
+    def submit(self, alert):
+        """Queues the alert if it is a transition or a heartbeat is due. Returns True when queued."""
+        self.submitted += 1
+        entity_id = alert["id"]
+        severity = alert.get("severity", {}).get("value")
+
+        due = (
+            severity != self.severity.get(entity_id)
+            or time.monotonic() - self.last_sent.get(entity_id, 0.0) >= self.heartbeat
+        )
+        if due or entity_id in self.pending:
+            # A newer alert always replaces one that has not gone out yet
+            self.pending[entity_id] = alert
+        return due
+
+    def _clears_fire(self, alert):
+        # A non-critical alert that changes the published severity (or the first one after a restart)
+        severity = alert.get("severity", {}).get("value")
+        return severity != "critical" and self.severity.get(alert["id"]) != severity
+
+    def _post(self, action, chunk):
+        try:
+            return self.session.post(self.update_url, json={"actionType": action, "entities": chunk}, timeout=5)
+        except requests.RequestException as e:
+            print(f"Connection Failed: {e}")
+            return None
+
+    def flush(self):
+        if not self.pending: return True
+
+        ok = True
+        alerts = list(self.pending.values())
+        # Back to normal: "replace" drops the fire's location and fires attributes, "append" would leave them on the entity
+        groups = (
+            ("append", [a for a in alerts if not self._clears_fire(a)]),
+            ("replace", [a for a in alerts if self._clears_fire(a)])
+        )
+        for action, group in groups:
+            for start in range(0, len(group), self.max_entities):
+                chunk = group[start:start + self.max_entities]
+                res = self._post(action, chunk)
+                if res is not None and res.status_code == 404 and action == "replace":
+                    # Entity not in Orion (yet): appending creates it without stale attributes
+                    res = self._post("append", chunk)
+                if res is None: return False
+
+                if res.status_code != 204:
+                    print(f"Batch update failed ({len(chunk)} alerts): {res.status_code} - {res.text}")
+                    ok = False
+                    continue
+
+                # Only mark as published once Orion accepted it, failures retry next flush
+                now = time.monotonic()
+                for alert in chunk:
+                    entity_id = alert["id"]
+                    self.severity[entity_id] = alert.get("severity", {}).get("value")
+                    self.last_sent[entity_id] = now
+                    self.pending.pop(entity_id, None)
+                    self.published += 1
+        return ok
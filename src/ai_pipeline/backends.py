@@ -0,0 +1,351 @@
+import os
+
+import cv2
+import numpy as np
+
+# Shared intra-op thread budget. The three models run one after the other,
+# so every runtime gets the same budget instead of each sizing its own pool.
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", "0")) or os.cpu_count() or 1
+
+# e.g. "OpenVINOExecutionProvider,CPUExecutionProvider" when onnxruntime-openvino is installed
+ONNX_PROVIDERS = [p.strip() for p in os.getenv("ONNX_PROVIDERS", "CPUExecutionProvider").split(",") if p.strip()]
+
+BACKEND_NAMES = ("native", "onnx")
+
+# When set, ONNX initializers are memory-mapped from here so that every worker
+# process of the supervisor shares the same physical weight pages
+SHARED_WEIGHTS_DIR = os.getenv("SHARED_WEIGHTS_DIR", "")
+
+
+# --- RUNTIME SETUP (frameworks are only imported when a backend needs them) ---
+
+def configure_torch():
+    import torch
+    torch.set_num_threads(INFERENCE_THREADS)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass # Already set by an earlier torch backend
+    return torch
+
+def configure_tensorflow():
+    import tensorflow as tf
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(INFERENCE_THREADS)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    except RuntimeError:
+        pass # TF runtime already initialized
+    return tf
+
+def _shared_weights_path(path):
+    return os.path.join(SHARED_WEIGHTS_DIR, os.path.splitext(os.path.basename(path))[0])
+
+def export_shared_weights(path):
+    """
+    Dumps the initializers of an ONNX model to one .npy file each (needs the onnx package).
+    Done once by the supervisor before it starts the workers.
+    """
+    import json
+    import onnx
+    from onnx import numpy_helper
+
+    out_dir = _shared_weights_path(path)
+    os.makedirs(out_dir, exist_ok=True)
+    index = {}
+    for i, init in enumerate(onnx.load(path).graph.initializer):
+        np.save(os.path.join(out_dir, f"{i}.npy"), numpy_helper.to_array(init))
+        index[init.name] = f"{i}.npy"
+    with open(os.path.join(out_dir, "index.json"), "w") as f:
+        json.dump(index, f)
+
+def _load_shared_weights(path):
+    import json
+    index_file = os.path.join(_shared_weights_path(path), "index.json")
+    if not os.path.exists(index_file): return {}
+    with open(index_file) as f:
+        index = json.load(f)
+    # copy-on-write maps: pages stay shared between processes as long as nobody writes
+    return {name: np.load(os.path.join(os.path.dirname(index_file), fname), mmap_mode="c") for name, fname in index.items()}
+
+def onnx_session(path):
+    import onnxruntime as ort
+    opts = ort.SessionOptions()
+    opts.intra_op_num_threads = INFERENCE_THREADS
+    opts.inter_op_num_threads = 1
+    opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+    shared = {}
+    if SHARED_WEIGHTS_DIR:
+        shared = {name: ort.OrtValue.ortvalue_from_numpy(arr) for name, arr in _load_shared_weights(path).items()}
+        # ORT uses these buffers directly instead of its own copy of the weights
+        for name, value in shared.items():
+            opts.add_initializer(name, value)
+
+    available = ort.get_available_providers()
+    providers = [p for p in ONNX_PROVIDERS if p in available] or ["CPUExecutionProvider"]
+    session = ort.InferenceSession(path, sess_options=opts, providers=providers)
+    session.shared_weights = shared # keep the mapped buffers alive with the session
+    return session
+
+
+# --- DETECTOR (YOLO) ---
+
+class UltralyticsDetector:
+    name = "native"
+
+    def __init__(self, path, target_classes):
+        configure_torch()
+        from ultralytics import YOLO
+        self.model = YOLO(path)
+        self.target_classes = target_classes
+
+    def warmup(self):
+        self.detect([np.zeros((640, 640, 3), dtype=np.uint8)], conf=0.5)
+
+    def detect(self, frames, conf):
+        results = self.model.predict(frames, conf=conf, verbose=False)
+        return [
+            [box.xyxy[0].tolist() for box in r.boxes if int(box.cls[0]) in self.target_classes]
+            for r in results
+        ]
+
+
+def letterbox(frame, imgsz, out):
+    """Fits frame into an imgsz square (grey padding) and writes it to out as RGB CHW float32 in [0, 1]."""
+    h, w = frame.shape[:2]
+    r = min(imgsz / h, imgsz / w)
+    nh, nw = int(round(h * r)), int(round(w * r))
+    top, left = (imgsz - nh) // 2, (imgsz - nw) // 2
+
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    canvas[top:top + nh, left:left + nw] = cv2.resize(frame, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    np.divide(canvas[..., ::-1].transpose(2, 0, 1), np.float32(255.0), out=out)
+    return r, left, top
+
+
+class OnnxDetector:
+    """
+    YOLOv8 exported with export_models.py.
+    Letterbox + NMS are done here since ultralytics (and torch) are not loaded.
+    """
+    name = "onnx"
+
+    def __init__(self, path, target_classes, imgsz=640, iou=0.7, max_det=300):
+        self.session = onnx_session(path)
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        self.imgsz = inp.shape[2] if isinstance(inp.shape[2], int) else imgsz
+        self.dynamic_batch = not isinstance(inp.shape[0], int)
+        self.target_classes = target_classes
+        self.iou = iou
+        self.max_det = max_det
+        self._buffer = None
+
+    def _letterbox(self, frame, out):
+        return letterbox(frame, self.imgsz, out)
+
+    def _postprocess(self, pred, conf, r, left, top, shape):
+        pred = pred.T # (anchors, 4 + classes)
+        class_scores = pred[:, 4:]
+        cls = class_scores.argmax(axis=1)
+        score = class_scores[np.arange(len(cls)), cls]
+
+        keep = (score >= conf) & np.isin(cls, self.target_classes)
+        if not keep.any(): return []
+        xywh, score, cls = pred[keep, :4], score[keep], cls[keep]
+
+        # center xywh (letterboxed) -> corner xyxy (original frame)
+        h, w = shape
+        x1 = np.clip((xywh[:, 0] - xywh[:, 2] / 2 - left) / r, 0, w)
+        y1 = np.clip((xywh[:, 1] - xywh[:, 3] / 2 - top) / r, 0, h)
+        x2 = np.clip((xywh[:, 0] + xywh[:, 2] / 2 - left) / r, 0, w)
+        y2 = np.clip((xywh[:, 1] + xywh[:, 3] / 2 - top) / r, 0, h)
+
+        nms_boxes = np.stack([x1, y1, x2 - x1, y2 - y1], axis=1).tolist()
+        idx = cv2.dnn.NMSBoxesBatched(nms_boxes, score.tolist(), cls.tolist(), conf, self.iou)
+        idx = np.array(idx).reshape(-1)[:self.max_det]
+        idx = idx[np.argsort(-score[idx])]
+        return [[float(x1[i]), float(y1[i]), float(x2[i]), float(y2[i])] for i in idx]
+
+    def warmup(self):
+        self.detect([np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8)], conf=0.5)
+
+    def detect(self, frames, conf):
+        n = len(frames)
+        if self._buffer is None or self._buffer.shape[0] < n:
+            self._buffer = np.empty((max(n, 8), 3, self.imgsz, self.imgsz), dtype=np.float32)
+        batch = self._buffer[:n]
+        metas = [self._letterbox(frame, batch[i]) + (frame.shape[:2],) for i, frame in enumerate(frames)]
+
+        if self.dynamic_batch:
+            preds = self.session.run(None, {self.input_name: batch})[0]
+        else:
+            preds = np.concatenate([self.session.run(None, {self.input_name: batch[i:i + 1]})[0] for i in range(n)])
+
+        return [self._postprocess(preds[i], conf, *metas[i]) for i in range(n)]
+
+
+# --- VERIFIER (FFireNet) ---
+
+class KerasClassifier:
+    name = "native"
+
+    def __init__(self, path):
+        tf = configure_tensorflow()
+        self.model = tf.keras.models.load_model(path)
+
+    def warmup(self):
+        self.predict(np.zeros((1, 224, 224, 3), dtype=np.float32))
+
+    def predict(self, batch):
+        return self.model.predict(batch, batch_size=len(batch), verbose=0)[:, 0]
+
+
+class OnnxClassifier:
+    name = "onnx"
+
+    def __init__(self, path):
+        self.session = onnx_session(path)
+        self.input_name = self.session.get_inputs()[0].name
+
+    def warmup(self):
+        self.predict(np.zeros((1, 224, 224, 3), dtype=np.float32))
+
+    def predict(self, batch):
+        return self.session.run(None, {self.input_name: batch})[0][:, 0]
+
+
+# --- DEPTH (MiDaS small) ---
+
+class TorchDepth:
+    name = "native"
+
+    def __init__(self):
+        self.torch = configure_torch()
+        self.device = self.torch.device("cuda") if self.torch.cuda.is_available() else self.torch.device("cpu")
+        print(f"Hardware Acceleration: {self.device}")
+        self.model = self.torch.hub.load("intel-isl/MiDaS", "MiDaS_small")
+        self.model.to(self.device).eval()
+        self.transform = self.torch.hub.load("intel-isl/MiDaS", "transforms").small_transform
+
+    def warmup(self):
+        self.estimate(np.zeros((256, 256, 3), dtype=np.uint8))
+
+    def estimate(self, frame):
+        torch = self.torch
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        input_batch = self.transform(rgb).to(self.device)
+        with torch.no_grad():
+            prediction = self.model(input_batch)
+            prediction = torch.nn.functional.interpolate(
+                prediction.unsqueeze(1),
+                size=frame.shape[:2],
+                mode="bicubic",
+                align_corners=False,
+            ).squeeze()
+        return prediction.cpu().numpy()
+
+
+class _MidasInput:
+    """
+    Mirrors MiDaS small_transform without the hub code: keep aspect, upper
+    bound 256, multiple of 32, ImageNet normalization. Output is resized back
+    to the frame bicubically.
+    """
+    MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+    STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+    size = 256
+    fixed_hw = None
+
+    @staticmethod
+    def _multiple_of(x, max_val, base=32):
+        y = int(round(x / base) * base)
+        if y > max_val: y = int(np.floor(x / base) * base)
+        return max(y, base)
+
+    def _input_hw(self, h, w):
+        if self.fixed_hw: return self.fixed_hw
+        scale = min(self.size / h, self.size / w)
+        return self._multiple_of(h * scale, self.size), self._multiple_of(w * scale, self.size)
+
+    def _prepare(self, frame):
+        h, w = frame.shape[:2]
+        in_h, in_w = self._input_hw(h, w)
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB).astype(np.float32) / 255.0
+        resized = cv2.resize(rgb, (in_w, in_h), interpolation=cv2.INTER_CUBIC)
+        normalized = (resized - self.MEAN) / self.STD
+        return np.ascontiguousarray(normalized.transpose(2, 0, 1)[None], dtype=np.float32)
+
+    @staticmethod
+    def _restore(prediction, frame):
+        h, w = frame.shape[:2]
+        prediction = prediction.reshape(prediction.shape[-2:])
+        return cv2.resize(prediction, (w, h), interpolation=cv2.INTER_CUBIC)
+
+    def warmup(self):
+        self.estimate(np.zeros((256, 256, 3), dtype=np.uint8))
+
+
+class OnnxDepth(_MidasInput):
+    name = "onnx"
+
+    def __init__(self, path):
+        self.session = onnx_session(path)
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        self.fixed_hw = tuple(inp.shape[2:]) if all(isinstance(d, int) for d in inp.shape[2:]) else None
+
+    def estimate(self, frame):
+        prediction = self.session.run(None, {self.input_name: self._prepare(frame)})[0]
+        return self._restore(prediction, frame)
+
+
+class TorchScriptDepth(_MidasInput):
+    """
+    Traced MiDaS small (export_models.py --only midas_torchscript).
+    Loads from a local file: no torch.hub, no GitHub, no weight download.
+    """
+    name = "native"
+
+    def __init__(self, path):
+        self.torch = configure_torch()
+        self.model = self.torch.jit.load(path, map_location="cpu").eval()
+
+    def estimate(self, frame):
+        with self.torch.inference_mode():
+            prediction = self.model(self.torch.from_numpy(self._prepare(frame))).numpy()
+        return self._restore(prediction, frame)
+
+
+# --- FACTORIES ---
+
+def _check(backend):
+    if backend not in BACKEND_NAMES:
+        raise ValueError(f"Unknown inference backend '{backend}' (expected one of {BACKEND_NAMES})")
+
+def model_path(paths, model, backend, quantized=False):
+    """PATHS entry for a model: native file, ONNX export, or its INT8 variant (quantize_models.py)."""
+    if backend == "onnx":
+        return paths[f"{model}_INT8" if quantized else f"{model}_ONNX"]
+    return paths.get(model)
+
+def load_detector(backend, paths, target_classes, quantized=False):
+    _check(backend)
+    if backend == "onnx":
+        return OnnxDetector(model_path(paths, "YOLO", backend, quantized), target_classes)
+    return UltralyticsDetector(paths["YOLO"], target_classes)
+
+def load_classifier(backend, paths, quantized=False):
+    _check(backend)
+    if backend == "onnx":
+        return OnnxClassifier(model_path(paths, "FFIRENET", backend, quantized))
+    return KerasClassifier(paths["FFIRENET"])
+
+def load_depth(backend, paths, offline=False, quantized=False):
+    _check(backend)
+    if backend == "onnx":
+        return OnnxDepth(model_path(paths, "MIDAS", backend, quantized))
+    if offline:
+        return TorchScriptDepth(paths["MIDAS_TORCHSCRIPT"])
+    return TorchDepth()
@@ -0,0 +1,206 @@
+"""
+Offline benchmark for FireDetectionEngine.
+Replays a folder of frames or a video file through process_frames() and reports
+fps, p50/p95/p99 latency per stage (yolo, ffirenet, midas, alert, frame),
+model load time and peak RSS as JSON. Frames are streamed from the source,
+one batch at a time, so the RSS figures measure the engine, not the clip.
+Usage: python benchmark.py --frames ../FireAdmin/public/captures [--batch 4] [--repeat 3] [--out bench.json]
+       python benchmark.py --video clip.mp4 --camera cam1 --max-frames 500
+"""
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import itertools
+import resource
+import platform
+from contextlib import redirect_stdout
+
+import cv2
+import numpy as np
+
+from ai_pipeline import FireDetectionEngine, PARAMS, BACKENDS
+
+STAGES = ("yolo", "ffirenet", "midas", "alert", "frame")
+
+
+def load_camera_configs(folder, location=None, rotation=0.0):
+    """
+    FireAdmin calibration files (<camera>_config.json) -> {camera: camera_meta}.
+    Location/rotation are not part of those files, so they are optional overrides.
+    """
+    metas = {}
+    for path in glob.glob(os.path.join(folder, "*_config.json")):
+        camera = os.path.basename(path)[:-len("_config.json")]
+        try:
+            with open(path) as f:
+                calib = float(json.load(f).get("calibration_c", 0))
+        except (ValueError, OSError) as e:
+            print(f"Skipping {path}: {e}", file=sys.stderr)
+            continue
+        meta = {"calibrationConstant": {"value": calib}, "rotationAngle": {"value": rotation}}
+        if location:
+            meta["location"] = {"type": "geo:json", "value": {"type": "Point", "coordinates": list(location)}}
+        metas[camera] = meta
+    return metas
+
+
+def iter_frames(source, camera=None, max_frames=0):
+    """
+    Yields (camera_id, frame, timestamp_seconds) from a folder of images or a video file.
+    Image folders use the file name as camera id (matches FireAdmin captures/configs).
+    """
+    count = 0
+    if os.path.isdir(source):
+        paths = sorted(p for ext in ("*.jpg", "*.jpeg", "*.png") for p in glob.glob(os.path.join(source, ext)))
+        for i, path in enumerate(paths):
+            frame = cv2.imread(path)
+            if frame is None: continue
+            yield camera or os.path.splitext(os.path.basename(path))[0], frame, float(i)
+            count += 1
+            if max_frames and count >= max_frames: return
+        return
+
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        raise SystemExit(f"Cannot open {source}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    camera = camera or os.path.splitext(os.path.basename(source))[0]
+    try:
+        while True:
+            ok, frame = cap.read()
+            if not ok: return
+            yield camera, frame, count / fps
+            count += 1
+            if max_frames and count >= max_frames: return
+    finally:
+        cap.release()
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if platform.system() == "Darwin" else 1024), 1)
+
+
+def summarize(samples):
+    if not samples:
+        return {"count": 0}
+    ms = np.asarray(samples) * 1000.0
+    return {
+        "count": int(ms.size),
+        "mean_ms": round(float(ms.mean()), 2),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        "max_ms": round(float(ms.max()), 2)
+    }
+
+
+def iter_chunks(frames, size, metas):
+    """Engine batches of at most size frames, decoded lazily so only one chunk is held in memory."""
+    while True:
+        chunk = [(frame, cam, metas.get(cam)) for cam, frame, _ in itertools.islice(frames, size)]
+        if not chunk: return
+        yield chunk
+
+
+def run_benchmark(source, camera, max_frames, metas, batch_size, repeat, warmup, backends=None):
+    # Peak RSS before the models load, so the engine's share is visible
+    baseline_rss = peak_rss_mb()
+    load_started = time.perf_counter()
+    engine = FireDetectionEngine(backends)
+    load_time = time.perf_counter() - load_started
+
+    if warmup:
+        for chunk in iter_chunks(iter_frames(source, camera, max(1, warmup)), max(1, warmup), metas):
+            engine.process_frames(chunk)
+
+    engine.timings = {}
+    frame_times = []
+    alerts = processed = 0
+    engine_time = 0.0
+    started = time.perf_counter()
+    for _ in range(repeat):
+        # Frames are streamed again on every pass instead of decoded into RAM up front
+        for chunk in iter_chunks(iter_frames(source, camera, max_frames), batch_size, metas):
+            t0 = time.perf_counter()
+            results = engine.process_frames(chunk)
+            elapsed = time.perf_counter() - t0
+            engine_time += elapsed
+            # Batched frames share the wall time of their chunk
+            frame_times += [elapsed / len(chunk)] * len(chunk)
+            processed += len(chunk)
+            alerts += sum(1 for a in results if a["severity"]["value"] == "critical")
+    wall = time.perf_counter() - started
+
+    timings = dict(engine.timings)
+    timings["frame"] = frame_times
+    return {
+        "backends": {**BACKENDS, **(backends or {})},
+        "frames": processed,
+        "batch_size": batch_size,
+        # Engine time only, decoding the source is reported separately
+        "fps": round(processed / engine_time, 2) if engine_time > 0 else None,
+        "wall_s": round(wall, 3),
+        "decode_s": round(wall - engine_time, 3),
+        "model_load_s": round(load_time, 3),
+        "startup": engine.startup_timings,
+        "baseline_rss_mb": baseline_rss,
+        "peak_rss_mb": peak_rss_mb(),
+        "critical_alerts": alerts,
+        "tracker": engine.tracker.stats() if engine.tracker is not None else None,
+        "stages": {stage: summarize(timings.get(stage, [])) for stage in STAGES}
+    }
+
+
+def parse_location(text):
+    if not text: return None
+    lng, lat = map(float, text.split(","))
+    return lng, lat
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    src = parser.add_mutually_exclusive_group(required=True)
+    src.add_argument('--frames', type=str, help="folder of .jpg/.png frames")
+    src.add_argument('--video', type=str, help="video file")
+    parser.add_argument('--configs', type=str, default="../FireAdmin/public/configs")
+    parser.add_argument('--camera', type=str, default=None, help="camera id for every frame (defaults to file name)")
+    parser.add_argument('--location', type=str, default=None, help="camera 'lng,lat' so geo-projection is timed too")
+    parser.add_argument('--max-frames', type=int, default=0)
+    parser.add_argument('--batch', type=int, default=PARAMS["BATCH_MAX_SIZE"])
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--backend', choices=["native", "onnx"], default=None, help="override INFERENCE_BACKEND for all models")
+    parser.add_argument('--depth-cache', action='store_true', help="keep the per-camera depth cache on (off by default so MiDaS is measured)")
+    parser.add_argument('--single-frame', action='store_true', help="judge every frame on its own (no temporal confirmation)")
+    parser.add_argument('--out', type=str, default=None, help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    if not args.depth_cache:
+        PARAMS["DEPTH_CACHE_TTL"] = 0
+    if args.single_frame:
+        PARAMS["TEMPORAL_CONFIRM"] = False
+
+    source = args.frames or args.video
+    if next(iter_frames(source, args.camera, 1), None) is None:
+        raise SystemExit("No frames to benchmark")
+    metas = load_camera_configs(args.configs, parse_location(args.location))
+
+    backends = {name: args.backend for name in BACKENDS} if args.backend else None
+    # Engine logs go to stderr so stdout stays valid JSON
+    with redirect_stdout(sys.stderr):
+        report = run_benchmark(source, args.camera, args.max_frames, metas, max(1, args.batch), max(1, args.repeat), args.warmup, backends)
+    report["source"] = source
+    report["params"] = {k: v for k, v in PARAMS.items() if not isinstance(v, (list, dict))}
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+        print(f"Benchmark written to {args.out}")
+    else:
+        print(output)
@@ -0,0 +1,45 @@
+import time
+
+from scene_gate import thumbnail, changed_fraction
+
+
+class DepthCache:
+    """
+    Per-camera MiDaS depth maps for fixed cameras.
+    An entry is reused until it is older than ttl seconds or the scene geometry
+    changed, i.e. more than max_change of the thumbnail differs from the frame
+    the map was computed on (flames/smoke alone stay well below that).
+    """
+
+    def __init__(self, ttl=300.0, max_change=0.2):
+        self.ttl = ttl
+        self.max_change = max_change
+        self.entries = {}   # camera_id -> (depth_map, thumbnail, frame shape, monotonic time)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, camera_id, frame):
+        entry = self.entries.get(camera_id)
+        if entry is not None:
+            depth_map, thumb, shape, created = entry
+            if (
+                time.monotonic() - created < self.ttl
+                and shape == frame.shape[:2]
+                and changed_fraction(thumbnail(frame), thumb) <= self.max_change
+            ):
+                self.hits += 1
+                return depth_map
+            del self.entries[camera_id]
+        self.misses += 1
+        return None
+
+    def put(self, camera_id, frame, depth_map):
+        now = time.monotonic()
+        # Drop expired maps so cameras without active fires do not hold memory
+        for cam in [c for c, e in self.entries.items() if now - e[3] >= self.ttl]:
+            del self.entries[cam]
+        self.entries[camera_id] = (depth_map, thumbnail(frame), frame.shape[:2], now)
+
+    def invalidate(self, camera_id=None):
+        if camera_id is None: self.entries.clear()
+        else: self.entries.pop(camera_id, None)
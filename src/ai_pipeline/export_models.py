@@ -0,0 +1,69 @@
+"""
+Exports the three models to ONNX once, for INFERENCE_BACKEND=onnx,
+and MiDaS to TorchScript for offline native startup (MODEL_OFFLINE=1).
+Needs the full build environment (ultralytics, tensorflow, torch) plus: pip install onnx tf2onnx
+Usage: python export_models.py [--only yolo ffirenet midas midas_torchscript] [--opset 17]
+"""
+import os
+import shutil
+import argparse
+
+from ai_pipeline import PATHS
+
+
+def export_yolo(opset):
+    from ultralytics import YOLO
+    # dynamic=True keeps the batch axis open for process_frames()
+    out = YOLO(PATHS["YOLO"]).export(format="onnx", dynamic=True, simplify=True, opset=opset, imgsz=640)
+    if os.path.abspath(out) != os.path.abspath(PATHS["YOLO_ONNX"]):
+        shutil.move(out, PATHS["YOLO_ONNX"])
+
+
+def export_ffirenet(opset):
+    import tensorflow as tf
+    model = tf.keras.models.load_model(PATHS["FFIRENET"])
+    try:
+        import tf2onnx
+    except ImportError:
+        raise SystemExit("tf2onnx is required to export FFireNet: pip install onnx tf2onnx")
+    spec = (tf.TensorSpec((None, 224, 224, 3), tf.float32, name="input"),)
+    tf2onnx.convert.from_keras(model, input_signature=spec, opset=opset, output_path=PATHS["FFIRENET_ONNX"])
+
+
+def export_midas(opset):
+    import torch
+    model = torch.hub.load("intel-isl/MiDaS", "MiDaS_small").eval()
+    dummy = torch.zeros(1, 3, 256, 256)
+    torch.onnx.export(
+        model, dummy, PATHS["MIDAS_ONNX"],
+        input_names=["input"], output_names=["depth"],
+        opset_version=opset,
+        dynamic_axes={"input": {2: "height", 3: "width"}, "depth": {1: "height", 2: "width"}},
+    )
+
+
+def export_midas_torchscript(opset):
+    import torch
+    model = torch.hub.load("intel-isl/MiDaS", "MiDaS_small").eval()
+    with torch.no_grad():
+        traced = torch.jit.trace(model, torch.zeros(1, 3, 256, 256))
+    traced.save(PATHS["MIDAS_TORCHSCRIPT"])
+
+
+EXPORTERS = {
+    "yolo": export_yolo,
+    "ffirenet": export_ffirenet,
+    "midas": export_midas,
+    "midas_torchscript": export_midas_torchscript,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--only', nargs='+', choices=list(EXPORTERS), default=list(EXPORTERS))
+    parser.add_argument('--opset', type=int, default=17)
+    args = parser.parse_args()
+
+    for name in args.only:
+        print(f"[Export] {name}...")
+        EXPORTERS[name](args.opset)
+        print(f"[Export] {name} done")
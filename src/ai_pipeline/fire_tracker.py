@@ -0,0 +1,113 @@
+from collections import deque
+from itertools import count
+
+TRACKER_PARAMS = {
+    "WINDOW": 5,               # frames of evidence kept per track
+    "MIN_HITS": 3,             # positive frames in the window needed to confirm a fire
+    "IOU_MATCH": 0.3,          # min IoU to continue a track with a new box
+    "MAX_MISSES": 5,           # frames without a box before a track is dropped
+    "AMBIGUOUS_MARGIN": 0.15,  # verifier scores this close to FFIRENET_CONF are re-checked
+    "REVERIFY_EVERY": 10       # re-run the verifier on a settled track at least this often (frames)
+}
+
+
+def box_iou(a, b):
+    ix = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+class Track:
+    _ids = count(1)
+
+    def __init__(self, bbox):
+        self.id = next(self._ids)
+        self.bbox = bbox
+        self.evidence = deque(maxlen=TRACKER_PARAMS["WINDOW"])
+        self.score = None           # last verifier score
+        self.since_verify = 0       # frames since the verifier last looked at this track
+        self.misses = 0
+
+
+class FireTracker:
+    """
+    Per-camera temporal confirmation of YOLO candidates.
+    Boxes are linked to tracks across frames by IoU; each frame adds one unit of
+    evidence (box seen + verifier score above threshold) to the track's sliding
+    window. FFireNet only runs for new tracks, ambiguous scores, or periodically.
+    """
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.tracks = {}            # camera_id -> [Track]
+        self.verifier_calls = 0
+        self.verifier_skipped = 0
+
+    def _needs_verify(self, track):
+        if track.score is None: return True
+        if abs(track.score - self.threshold) <= TRACKER_PARAMS["AMBIGUOUS_MARGIN"]: return True
+        return track.since_verify >= TRACKER_PARAMS["REVERIFY_EVERY"]
+
+    def associate(self, camera_id, boxes):
+        """
+        Matches this frame's boxes to the camera's tracks (greedy, best IoU first).
+        Returns [(track, needs_verify)] aligned with boxes. Unmatched tracks age out.
+        """
+        tracks = self.tracks.setdefault(camera_id, [])
+        pairs = sorted(
+            ((box_iou(t.bbox, b), ti, bi) for ti, t in enumerate(tracks) for bi, b in enumerate(boxes)),
+            reverse=True
+        )
+
+        assigned, used = {}, set()
+        for iou, ti, bi in pairs:
+            if iou < TRACKER_PARAMS["IOU_MATCH"]: break
+            if ti in used or bi in assigned: continue
+            assigned[bi] = tracks[ti]
+            used.add(ti)
+
+        for ti, track in enumerate(tracks):
+            if ti not in used:
+                track.misses += 1
+                track.evidence.append(0)
+        tracks[:] = [t for t in tracks if t.misses <= TRACKER_PARAMS["MAX_MISSES"]]
+
+        matches = []
+        for bi, bbox in enumerate(boxes):
+            track = assigned.get(bi)
+            if track is None:
+                track = Track(bbox)
+                tracks.append(track)
+            track.bbox = bbox
+            track.misses = 0
+            need = self._needs_verify(track)
+            if need: self.verifier_calls += 1
+            else: self.verifier_skipped += 1
+            matches.append((track, need))
+        return matches
+
+    def update(self, track, score=None):
+        """Adds this frame's evidence; score is None when the verifier was skipped."""
+        if score is not None:
+            track.score = score
+            track.since_verify = 0
+        else:
+            track.since_verify += 1
+        track.evidence.append(1 if track.score is not None and track.score > self.threshold else 0)
+
+    def is_confirmed(self, track):
+        return sum(track.evidence) >= TRACKER_PARAMS["MIN_HITS"]
+
+    def forget(self, camera_id):
+        self.tracks.pop(camera_id, None)
+
+    def stats(self):
+        total = self.verifier_calls + self.verifier_skipped
+        return {
+            "tracks": sum(len(t) for t in self.tracks.values()),
+            "verifier_calls": self.verifier_calls,
+            "verifier_skipped": self.verifier_skipped,
+            "skip_rate": round(self.verifier_skipped / total, 3) if total else 0.0
+        }
@@ -0,0 +1,229 @@
+import os
+import time
+import threading
+from urllib.parse import unquote
+
+import cv2
+import requests
+
+# Same transport the screenshot service uses (ffmpeg rtsp_transport=tcp)
+os.environ.setdefault("OPENCV_FFMPEG_CAPTURE_OPTIONS", "rtsp_transport;tcp")
+
+GRABBER_PARAMS = {
+    "RING_SLOTS": 3,            # latest + leased + one being written
+    "RECONNECT_DELAY": 2.0,     # first retry after a dropped stream (doubles up to MAX)
+    "RECONNECT_DELAY_MAX": 30.0,
+    "REGISTRY_REFRESH": 60.0,   # seconds between Orion Camera registry syncs
+    "STALE_AFTER": 10.0         # frames older than this are not handed to the engine
+}
+
+
+def fetch_camera_registry(orion_url, service_path):
+    """
+    Reads every Camera entity from Orion.
+    Returns {camera_id: (source, camera_meta)}.
+    """
+    headers = {
+        "Accept": "application/json",
+        "Fiware-ServicePath": service_path
+    }
+    res = requests.get(orion_url, headers=headers, params={"type": "Camera", "limit": 1000}, timeout=10)
+    res.raise_for_status()
+
+    registry = {}
+    for camera in res.json():
+        if "rtspUrl" not in camera: continue
+        registry[camera["id"]] = (
+            unquote(camera["rtspUrl"]["value"]),
+            {
+                "location": camera.get("location", {}),
+                "rotationAngle": camera.get("rotationAngle", {}),
+                "calibrationConstant": camera.get("calibrationConstant", {})
+            }
+        )
+    return registry
+
+
+def parse_static_sources(spec):
+    """
+    "cam1=/data/fire.mp4,cam2=rtsp://127.0.0.1:8554/test" -> registry dict.
+    Stand-in for Orion when testing with local files or loopback streams.
+    """
+    registry = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item: continue
+        camera_id, _, source = item.partition("=")
+        if not source:
+            camera_id, source = os.path.splitext(os.path.basename(item))[0], item
+        registry[camera_id.strip()] = (source.strip(), {})
+    return registry
+
+
+class FrameGrabber(threading.Thread):
+    """
+    Long-lived decoder for one camera.
+    Decodes into a small ring of frame buffers and only remembers the newest one,
+    so the engine always sees the latest frame and never waits on ffmpeg.
+    """
+
+    def __init__(self, camera_id, source, camera_meta=None):
+        super().__init__(name=f"grabber-{camera_id}", daemon=True)
+        self.camera_id = camera_id
+        self.source = source
+        self.camera_meta = camera_meta or {}
+
+        self._slots = [None] * GRABBER_PARAMS["RING_SLOTS"]
+        self._latest = -1       # slot holding the newest frame
+        self._leased = -1       # slot currently handed to the engine
+        self._seq = 0           # frames decoded so far
+        self._read_seq = 0      # seq of the last frame handed out
+        self._timestamp = 0.0
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+        # Local files are replayed at their native rate and looped
+        self.is_file = os.path.isfile(source)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _next_write_slot(self):
+        with self._lock:
+            for i in range(len(self._slots)):
+                if i != self._latest and i != self._leased:
+                    return i
+        return 0
+
+    def _publish(self, slot, frame):
+        with self._lock:
+            self._slots[slot] = frame
+            self._latest = slot
+            self._seq += 1
+            self._timestamp = time.time()
+
+    def read(self):
+        """
+        Returns (frame, seq, timestamp) for the newest frame, without copying.
+        The frame stays valid until the next read() on this grabber.
+        """
+        with self._lock:
+            if self._latest < 0:
+                return None, 0, 0.0
+            self._leased = self._latest
+            self._read_seq = self._seq
+            return self._slots[self._leased], self._seq, self._timestamp
+
+    def has_new_frame(self):
+        with self._lock:
+            return self._latest >= 0 and self._seq != self._read_seq \
+                and time.time() - self._timestamp < GRABBER_PARAMS["STALE_AFTER"]
+
+    def run(self):
+        delay = GRABBER_PARAMS["RECONNECT_DELAY"]
+
+        while not self._stop_event.is_set():
+            cap = cv2.VideoCapture(self.source, cv2.CAP_FFMPEG)
+            if not cap.isOpened():
+                print(f"[Ingest] {self.camera_id}: cannot open stream, retrying in {delay:.0f}s")
+                self._stop_event.wait(delay)
+                delay = min(delay * 2, GRABBER_PARAMS["RECONNECT_DELAY_MAX"])
+                continue
+
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            frame_interval = 0.0
+            if self.is_file:
+                fps = cap.get(cv2.CAP_PROP_FPS)
+                frame_interval = 1.0 / fps if fps and fps > 0 else 0.04
+
+            print(f"[Ingest] {self.camera_id}: stream opened")
+            delay = GRABBER_PARAMS["RECONNECT_DELAY"]
+
+            while not self._stop_event.is_set():
+                started = time.monotonic()
+                slot = self._next_write_slot()
+                # Decode directly into the ring slot when the shape matches
+                ok, frame = cap.read(self._slots[slot])
+                if not ok or frame is None:
+                    if self.is_file:
+                        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                        continue
+                    print(f"[Ingest] {self.camera_id}: stream dropped")
+                    break
+                self._publish(slot, frame)
+
+                if frame_interval:
+                    self._stop_event.wait(max(0.0, frame_interval - (time.monotonic() - started)))
+
+            cap.release()
+
+
+class GrabberPool:
+    """
+    One FrameGrabber per camera, kept in sync with the camera registry.
+    """
+
+    def __init__(self, registry_loader):
+        self.registry_loader = registry_loader
+        self.grabbers = {}
+        self._cursor = 0
+        self._last_sync = 0.0
+
+    def sync(self):
+        try:
+            registry = self.registry_loader()
+        except Exception as e:
+            print(f"[Ingest] Camera registry fetch failed: {e}")
+            return
+        self._last_sync = time.monotonic()
+
+        for camera_id in list(self.grabbers):
+            source, meta = registry.get(camera_id, (None, None))
+            if source != self.grabbers[camera_id].source:
+                self.grabbers.pop(camera_id).stop()
+                print(f"[Ingest] {camera_id}: grabber stopped")
+            elif meta:
+                self.grabbers[camera_id].camera_meta = meta
+
+        for camera_id, (source, meta) in registry.items():
+            if camera_id not in self.grabbers:
+                grabber = FrameGrabber(camera_id, source, meta)
+                grabber.start()
+                self.grabbers[camera_id] = grabber
+
+    def request_sync(self):
+        # Picked up by the next next_batch() call, on the thread that owns the pool
+        self._last_sync = float("-inf")
+
+    def next_batch(self, max_size, exclude=()):
+        """
+        Latest unseen frame from up to max_size cameras, round robin so that
+        every camera gets its turn when more than max_size have new frames.
+        Cameras in exclude are skipped (their leased frame stays valid).
+        Returns [(frame, camera_id, camera_meta), ...].
+        """
+        if time.monotonic() - self._last_sync > GRABBER_PARAMS["REGISTRY_REFRESH"]:
+            self.sync()
+
+        ids = list(self.grabbers)
+        if not ids: return []
+
+        batch = []
+        start = self._cursor % len(ids)
+        for offset in range(len(ids)):
+            grabber = self.grabbers[ids[(start + offset) % len(ids)]]
+            if grabber.camera_id in exclude or not grabber.has_new_frame(): continue
+            frame, _, _ = grabber.read()
+            if frame is None: continue
+            batch.append((frame, grabber.camera_id, grabber.camera_meta))
+            if len(batch) >= max_size:
+                self._cursor = start + offset + 1
+                break
+        else:
+            self._cursor = start + 1
+        return batch
+
+    def stop(self):
+        for grabber in self.grabbers.values():
+            grabber.stop()
+        self.grabbers = {}
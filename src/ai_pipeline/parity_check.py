@@ -0,0 +1,139 @@
+"""
+Parity test: ONNX Runtime backends vs the native ultralytics / Keras / torch.hub ones.
+Runs both on the same frames and fails (exit code 1) when any model drifts past its tolerance.
+Usage: python parity_check.py [--frames ../FireAdmin/public/captures] [--only yolo ffirenet midas]
+"""
+import os
+import sys
+import glob
+import argparse
+
+import cv2
+import numpy as np
+
+from ai_pipeline import PATHS, PARAMS
+from backends import load_classifier, load_depth, load_detector
+
+TARGET_CLASSES = [0, 1]
+
+
+def load_frames(folder):
+    frames = []
+    for path in sorted(glob.glob(os.path.join(folder, "*.jpg")) + glob.glob(os.path.join(folder, "*.png"))):
+        frame = cv2.imread(path)
+        if frame is not None: frames.append((os.path.basename(path), frame))
+    return frames
+
+
+def iou(a, b):
+    ix = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def box_agreement(ref, other, thr):
+    # Greedy one-to-one matching; 1.0 when both found nothing
+    if not ref and not other: return 1.0
+    unmatched = list(other)
+    matched = 0
+    for box in ref:
+        best = max(unmatched, key=lambda o: iou(box, o), default=None)
+        if best is not None and iou(box, best) >= thr:
+            matched += 1
+            unmatched.remove(best)
+    return matched / max(len(ref), len(other))
+
+
+def check_yolo(frames, args):
+    native = load_detector("native", PATHS, TARGET_CLASSES)
+    onnx = load_detector("onnx", PATHS, TARGET_CLASSES)
+    images = [f for _, f in frames]
+    ref = native.detect(images, conf=PARAMS["YOLO_CONF"])
+    out = onnx.detect(images, conf=PARAMS["YOLO_CONF"])
+
+    scores = [box_agreement(r, o, args.iou) for r, o in zip(ref, out)]
+    for (name, _), r, o, s in zip(frames, ref, out, scores):
+        if s < 1.0: print(f"  {name}: native {len(r)} boxes, onnx {len(o)} boxes, agreement {s:.2f}")
+    agreement = float(np.mean(scores))
+    print(f"[YOLO] box agreement {agreement:.3f} (min {args.min_box_agreement})")
+    return agreement >= args.min_box_agreement, ref
+
+
+def crops_for(frames, boxes):
+    # YOLO candidates when there are any, otherwise a centre crop, so every frame is scored
+    batch = []
+    for (_, frame), frame_boxes in zip(frames, boxes):
+        h, w = frame.shape[:2]
+        regions = frame_boxes or [[w * 0.25, h * 0.25, w * 0.75, h * 0.75]]
+        for x1, y1, x2, y2 in regions:
+            crop = frame[int(y1):int(y2), int(x1):int(x2)]
+            if crop.size == 0: continue
+            rgb = cv2.cvtColor(cv2.resize(crop, (224, 224)), cv2.COLOR_BGR2RGB)
+            batch.append(rgb.astype(np.float32) / 255.0)
+    return np.stack(batch) if batch else np.zeros((0, 224, 224, 3), dtype=np.float32)
+
+
+def check_ffirenet(frames, boxes, args):
+    batch = crops_for(frames, boxes)
+    if not len(batch):
+        print("[FFireNet] no crops to compare")
+        return True
+    ref = load_classifier("native", PATHS).predict(batch)
+    out = load_classifier("onnx", PATHS).predict(batch)
+
+    diff = float(np.max(np.abs(ref - out)))
+    flips = int(np.sum((ref > PARAMS["FFIRENET_CONF"]) != (out > PARAMS["FFIRENET_CONF"])))
+    print(f"[FFireNet] {len(batch)} crops, max |score diff| {diff:.4f} (max {args.max_score_diff}), decision flips {flips}")
+    return diff <= args.max_score_diff and flips == 0
+
+
+def check_midas(frames, args):
+    native = load_depth("native", PATHS)
+    onnx = load_depth("onnx", PATHS)
+
+    worst = 0.0
+    for name, frame in frames:
+        ref = native.estimate(frame)
+        out = onnx.estimate(frame)
+        # Distances come from box medians, so compare the median over the centre region
+        h, w = ref.shape
+        region = (slice(h // 4, 3 * h // 4), slice(w // 4, 3 * w // 4))
+        ref_med, out_med = float(np.median(ref[region])), float(np.median(out[region]))
+        rel = abs(ref_med - out_med) / max(abs(ref_med), 1e-6)
+        worst = max(worst, rel)
+        if rel > args.max_depth_rel: print(f"  {name}: median depth native {ref_med:.2f} vs onnx {out_med:.2f}")
+
+    print(f"[MiDaS] worst relative median-depth error {worst:.4f} (max {args.max_depth_rel})")
+    return worst <= args.max_depth_rel
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=str, default="../FireAdmin/public/captures")
+    parser.add_argument('--only', nargs='+', choices=["yolo", "ffirenet", "midas"], default=["yolo", "ffirenet", "midas"])
+    parser.add_argument('--iou', type=float, default=0.5)
+    parser.add_argument('--min-box-agreement', type=float, default=0.95)
+    parser.add_argument('--max-score-diff', type=float, default=0.02)
+    parser.add_argument('--max-depth-rel', type=float, default=0.05)
+    args = parser.parse_args()
+
+    frames = load_frames(args.frames)
+    if not frames:
+        print(f"No frames found in {args.frames}")
+        sys.exit(1)
+    print(f"Comparing backends on {len(frames)} frames")
+
+    ok = True
+    boxes = [[] for _ in frames]
+    if "yolo" in args.only:
+        passed, boxes = check_yolo(frames, args)
+        ok &= passed
+    if "ffirenet" in args.only:
+        ok &= check_ffirenet(frames, boxes, args)
+    if "midas" in args.only:
+        ok &= check_midas(frames, args)
+
+    print("PARITY OK" if ok else "PARITY FAILED")
+    sys.exit(0 if ok else 1)
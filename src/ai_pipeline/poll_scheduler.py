@@ -0,0 +1,248 @@
+import math
+import time
+import threading
+from collections import deque
+
+import requests
+
+SCHED_PARAMS = {
+    "ENABLED": True,
+    "BASE_INTERVAL": 10.0,       # seconds between samples of a quiet camera
+    "MIN_INTERVAL": 1.0,         # fastest a hot camera is sampled (quiet ones are never capped)
+    "HOT_PRIORITY": 1.5,         # priority from which a camera counts as hot
+    "MAX_REVISIT": 15.0,         # guaranteed: every camera is sampled at least this often (served first when overdue)
+    "CANDIDATE_WEIGHT": 4.0,     # priority added by YOLO candidates (smoke, flames not yet confirmed)
+    "CRITICAL_WEIGHT": 8.0,      # priority added by a critical alert
+    "OCCUPANCY_WEIGHT": 2.0,     # priority added by people near the camera (CrowdFlowObserved)
+    "RISK_DECAY": 60.0,          # seconds for candidate/critical priority to fall to 1/e
+    "OCCUPANCY_RADIUS": 75.0,    # metres around the camera counted as "nearby"
+    "OCCUPANCY_FULL": 20,        # people nearby that give the full occupancy weight
+    "OCCUPANCY_REFRESH": 30.0,   # how often CrowdFlowObserved is re-read (seconds)
+    "REGISTRY_REFRESH": 60.0,    # how often the camera list is re-read (seconds)
+    "RATE_WINDOW": 120.0,        # window for the effective sampling rate
+    "REPORT_INTERVAL": 60.0
+}
+
+
+def distance_m(lng1, lat1, lng2, lat2):
+    # Equirectangular approximation, plenty for a few hundred metres
+    x = math.radians(lng2 - lng1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return 6371000.0 * math.hypot(x, y)
+
+
+def camera_position(meta):
+    coords = ((meta or {}).get("location") or {}).get("value", {}).get("coordinates")
+    return tuple(coords[:2]) if coords and len(coords) >= 2 else None
+
+
+class PollScheduler:
+    """
+    Decides which camera is sampled next instead of a fixed round robin.
+    Each camera gets a priority from recent YOLO candidates, recent critical
+    alerts (both decaying) and occupancy from nearby CrowdFlowObserved entities;
+    its target interval is BASE_INTERVAL / priority, clamped to
+    [MIN_INTERVAL, MAX_REVISIT]. The intervals only rank cameras: whenever
+    there is capacity the most urgent camera is served, cameras past
+    MAX_REVISIT first, then the one furthest past its own interval. Only hot
+    cameras are held back, for MIN_INTERVAL after each sample, so they cannot
+    monopolize the fetches.
+    Orion is re-read on a background thread, never on the caller's thread.
+    """
+
+    def __init__(self, registry_loader, orion_url=None, service_path=None):
+        self.registry_loader = registry_loader
+        self.orion_url = orion_url
+        self.service_path = service_path
+
+        self.registry = {}           # camera_id -> camera_meta
+        self.last_sample = {}        # camera_id -> monotonic time of the last sample
+        self.last_candidate = {}     # camera_id -> monotonic time YOLO last saw something
+        self.last_critical = {}      # camera_id -> monotonic time of the last critical alert
+        self.occupancy = {}          # camera_id -> people within OCCUPANCY_RADIUS
+        self.samples = {}            # camera_id -> deque of sample times within RATE_WINDOW
+
+        self._lock = threading.Lock()     # staged mode fetches from several threads
+        self._refresh_lock = threading.Lock()
+        self._refreshing = False
+        self._registry_at = None
+        self._occupancy_at = None
+        self._last_report = time.monotonic()
+
+    # --- INPUTS ---
+
+    def refresh(self, registry=True, occupancy=True):
+        """Re-reads the camera registry and occupancy. Blocking: startup and the refresh thread only."""
+        if registry:
+            self._registry_at = time.monotonic()
+            try:
+                fresh = {cid: meta for cid, (_, meta) in self.registry_loader().items()}
+            except Exception as e:
+                print(f"[Scheduler] camera registry refresh failed: {e}")
+            else:
+                now = time.monotonic()
+                with self._lock:
+                    for camera_id in fresh:
+                        # New cameras count as overdue so they are picked up right away
+                        self.last_sample.setdefault(camera_id, now - SCHED_PARAMS["MAX_REVISIT"])
+                    self.registry = fresh
+
+        if occupancy and self.orion_url:
+            self._occupancy_at = time.monotonic()
+            self._refresh_occupancy()
+
+    def _refresh(self, now):
+        # Called from the staged pipeline's event loop too, so Orion is only read on a background thread
+        registry = self._registry_at is None or now - self._registry_at >= SCHED_PARAMS["REGISTRY_REFRESH"]
+        occupancy = bool(self.orion_url) and (self._occupancy_at is None or now - self._occupancy_at >= SCHED_PARAMS["OCCUPANCY_REFRESH"])
+        if not (registry or occupancy): return
+        with self._refresh_lock:
+            if self._refreshing: return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, args=(registry, occupancy), daemon=True, name="scheduler-refresh").start()
+
+    def _background_refresh(self, registry, occupancy):
+        try:
+            self.refresh(registry, occupancy)
+        finally:
+            self._refreshing = False
+
+    def _refresh_occupancy(self):
+        try:
+            res = requests.get(
+                self.orion_url,
+                headers={"Accept": "application/json", "Fiware-ServicePath": self.service_path},
+                params={"type": "CrowdFlowObserved", "options": "keyValues", "limit": 1000},
+                timeout=5
+            )
+            res.raise_for_status()
+            observed = res.json()
+        except (requests.RequestException, ValueError) as e:
+            print(f"[Scheduler] CrowdFlowObserved refresh failed: {e}")
+            return
+
+        points = []
+        for entity in observed:
+            coords = (entity.get("location") or {}).get("coordinates")
+            try:
+                count = max(0, int(entity.get("peopleCount") or 0))
+            except (TypeError, ValueError):
+                continue
+            if coords and count: points.append((coords[0], coords[1], count))
+
+        occupancy = {}
+        for camera_id, meta in self.registry.items():
+            pos = camera_position(meta)
+            if pos is None: continue
+            occupancy[camera_id] = sum(
+                count for lng, lat, count in points
+                if distance_m(pos[0], pos[1], lng, lat) <= SCHED_PARAMS["OCCUPANCY_RADIUS"]
+            )
+        self.occupancy = occupancy
+
+    def observe(self, camera_id, alert=None, candidates=0):
+        """Feeds back the engine's view of a camera after a full pass."""
+        now = time.monotonic()
+        if candidates:
+            self.last_candidate[camera_id] = now
+        if alert is not None and alert.get("severity", {}).get("value") == "critical":
+            self.last_critical[camera_id] = now
+
+    def record_sample(self, camera_id):
+        now = time.monotonic()
+        self.last_sample[camera_id] = now
+        window = self.samples.setdefault(camera_id, deque())
+        window.append(now)
+        while window and now - window[0] > SCHED_PARAMS["RATE_WINDOW"]:
+            window.popleft()
+
+    # --- SCHEDULING ---
+
+    def priority(self, camera_id, now=None):
+        now = now or time.monotonic()
+        decay = lambda t: math.exp(-(now - t) / SCHED_PARAMS["RISK_DECAY"]) if t is not None else 0.0
+        occupancy = min(1.0, self.occupancy.get(camera_id, 0) / SCHED_PARAMS["OCCUPANCY_FULL"])
+        return (
+            1.0
+            + SCHED_PARAMS["CANDIDATE_WEIGHT"] * decay(self.last_candidate.get(camera_id))
+            + SCHED_PARAMS["CRITICAL_WEIGHT"] * decay(self.last_critical.get(camera_id))
+            + SCHED_PARAMS["OCCUPANCY_WEIGHT"] * occupancy
+        )
+
+    def interval(self, camera_id, now=None):
+        target = SCHED_PARAMS["BASE_INTERVAL"] / self.priority(camera_id, now)
+        return min(SCHED_PARAMS["MAX_REVISIT"], max(SCHED_PARAMS["MIN_INTERVAL"], target))
+
+    def _urgency(self, camera_id, now):
+        waited = now - self.last_sample.get(camera_id, 0.0)
+        if waited >= SCHED_PARAMS["MAX_REVISIT"]:
+            return (1, waited)       # revisit guarantee: oldest first
+        return (0, waited / self.interval(camera_id, now))
+
+    def _capped(self, camera_id, now):
+        # Rate cap for hot cameras only; quiet ones are served whenever there is capacity
+        return (
+            now - self.last_sample.get(camera_id, 0.0) < SCHED_PARAMS["MIN_INTERVAL"]
+            and self.priority(camera_id, now) >= SCHED_PARAMS["HOT_PRIORITY"]
+        )
+
+    def ranked(self, exclude=()):
+        """Cameras that may be sampled now, most urgent first."""
+        now = time.monotonic()
+        self._refresh(now)
+        ranked = sorted(
+            ((self._urgency(cid, now), cid) for cid in self.registry if cid not in exclude and not self._capped(cid, now)),
+            reverse=True
+        )
+        return [cid for _, cid in ranked]
+
+    def next(self, exclude=()):
+        """Most urgent camera, or None when all are excluded or rate-capped. Records the sample."""
+        with self._lock:
+            ranked = self.ranked(exclude)
+            if not ranked: return None
+            self.record_sample(ranked[0])
+            return ranked[0]
+
+    def held_back(self):
+        """Hot cameras inside their MIN_INTERVAL (exclude set for grabber/ring batches)."""
+        now = time.monotonic()
+        self._refresh(now)
+        return {cid for cid in self.registry if self._capped(cid, now)}
+
+    def idle_time(self, cap):
+        """Seconds until some camera may be sampled, 0 while any is available, at most cap."""
+        now = time.monotonic()
+        self._refresh(now)
+        if not self.registry: return cap
+        waits = [
+            self.last_sample.get(cid, 0.0) + SCHED_PARAMS["MIN_INTERVAL"] - now if self._capped(cid, now) else 0.0
+            for cid in self.registry
+        ]
+        return max(0.0, min([cap] + waits))
+
+    # --- METRICS ---
+
+    def rates(self):
+        """Effective per-camera sampling: measured rate over RATE_WINDOW, target interval and priority."""
+        now = time.monotonic()
+        out = {}
+        for camera_id in self.registry:
+            window = [t for t in self.samples.get(camera_id, ()) if now - t <= SCHED_PARAMS["RATE_WINDOW"]]
+            out[camera_id] = {
+                "rate_hz": round(len(window) / SCHED_PARAMS["RATE_WINDOW"], 3),
+                "target_interval_s": round(self.interval(camera_id, now), 2),
+                "priority": round(self.priority(camera_id, now), 2),
+                "occupancy": self.occupancy.get(camera_id, 0)
+            }
+        return out
+
+    def report(self):
+        now = time.monotonic()
+        if now - self._last_report < SCHED_PARAMS["REPORT_INTERVAL"]: return
+        self._last_report = now
+        rates = self.rates()
+        if not rates: return
+        top = sorted(rates.items(), key=lambda kv: kv[1]["priority"], reverse=True)[:5]
+        summary = ", ".join(f"{cid.split(':')[-1]} {r['rate_hz']}Hz (p{r['priority']})" for cid, r in top)
+        print(f"[Scheduler] {len(rates)} cameras | top: {summary}")
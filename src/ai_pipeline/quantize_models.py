@@ -0,0 +1,215 @@
+"""
+Post-training INT8 quantization of the ONNX exports (run export_models.py first),
+for QUANTIZED_MODELS=1 with INFERENCE_BACKEND=onnx.
+Static mode calibrates activations on a small frame corpus (QDQ format),
+dynamic mode only quantizes weights and needs no frames.
+--report compares FP32 and INT8 latency and agreement on the same frames as JSON.
+Usage: python quantize_models.py [--frames ../FireAdmin/public/captures] [--mode static|dynamic] [--only yolo ffirenet midas]
+       python quantize_models.py --report-only --out quant_report.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from contextlib import redirect_stdout
+
+import numpy as np
+
+from ai_pipeline import PATHS, PARAMS
+from backends import letterbox, load_classifier, load_depth, load_detector, OnnxDepth
+from benchmark import summarize
+from parity_check import TARGET_CLASSES, load_frames, box_agreement, crops_for
+
+MODELS = {"yolo": "YOLO", "ffirenet": "FFIRENET", "midas": "MIDAS"}
+
+
+def yolo_inputs(frames):
+    for _, frame in frames:
+        blob = np.empty((1, 3, 640, 640), dtype=np.float32)
+        letterbox(frame, 640, blob[0])
+        yield blob
+
+
+def ffirenet_inputs(frames):
+    # Same crops the parity check scores: centre crop per frame without YOLO boxes
+    for crop in crops_for(frames, [[] for _ in frames]):
+        yield crop[None]
+
+
+def midas_inputs(frames):
+    prep = OnnxDepth(PATHS["MIDAS_ONNX"])
+    for _, frame in frames:
+        yield prep._prepare(frame)
+
+
+CALIBRATION_INPUTS = {"yolo": yolo_inputs, "ffirenet": ffirenet_inputs, "midas": midas_inputs}
+
+
+def calibration_reader(model, frames):
+    from onnxruntime import InferenceSession
+    from onnxruntime.quantization import CalibrationDataReader
+
+    input_name = InferenceSession(PATHS[MODELS[model] + "_ONNX"], providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self):
+            self.inputs = iter(CALIBRATION_INPUTS[model](frames))
+
+        def get_next(self):
+            blob = next(self.inputs, None)
+            return None if blob is None else {input_name: blob}
+
+    return FrameReader()
+
+
+def quantize(model, mode, frames):
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_dynamic, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    src, dst = PATHS[MODELS[model] + "_ONNX"], PATHS[MODELS[model] + "_INT8"]
+    if not os.path.exists(src):
+        raise SystemExit(f"{src} not found, run export_models.py --only {model} first")
+
+    # Shape inference + graph cleanup first, as recommended by onnxruntime for CNNs
+    prepped = dst + ".prep.onnx"
+    quant_pre_process(src, prepped, skip_symbolic_shape=True)
+    try:
+        if mode == "dynamic":
+            quantize_dynamic(prepped, dst, weight_type=QuantType.QInt8)
+        else:
+            quantize_static(
+                prepped, dst, calibration_reader(model, frames),
+                quant_format=QuantFormat.QDQ,
+                activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+                per_channel=True
+            )
+    finally:
+        os.remove(prepped)
+
+    size = lambda p: round(os.path.getsize(p) / (1024 * 1024), 1)
+    print(f"[Quantize] {model}: {src} ({size(src)} MB) -> {dst} ({size(dst)} MB)")
+
+
+# --- REPORT ---
+
+def timed(fn, items):
+    outputs, samples = [], []
+    for item in items:
+        t0 = time.perf_counter()
+        outputs.append(fn(item))
+        samples.append(time.perf_counter() - t0)
+    return outputs, samples
+
+
+def speedup(fp32, int8):
+    if not fp32.get("count") or not int8.get("count"): return None
+    return round(fp32["p50_ms"] / int8["p50_ms"], 2)
+
+
+def report_yolo(frames, iou_thr):
+    fp32, int8 = (load_detector("onnx", PATHS, TARGET_CLASSES, quantized=q) for q in (False, True))
+    for m in (fp32, int8): m.warmup()
+    images = [[f] for _, f in frames]
+    ref, ref_t = timed(lambda b: fp32.detect(b, conf=PARAMS["YOLO_CONF"])[0], images)
+    out, out_t = timed(lambda b: int8.detect(b, conf=PARAMS["YOLO_CONF"])[0], images)
+
+    scores = [box_agreement(r, o, iou_thr) for r, o in zip(ref, out)]
+    lat = {"fp32": summarize(ref_t), "int8": summarize(out_t)}
+    return {
+        "latency": lat,
+        "speedup_p50": speedup(lat["fp32"], lat["int8"]),
+        "box_agreement": round(float(np.mean(scores)), 4),
+        "frames_with_fire": {"fp32": sum(1 for r in ref if r), "int8": sum(1 for o in out if o)}
+    }, ref
+
+
+def report_ffirenet(frames, boxes):
+    crops = crops_for(frames, boxes)
+    if not len(crops): return {"crops": 0}
+    fp32, int8 = (load_classifier("onnx", PATHS, quantized=q) for q in (False, True))
+    for m in (fp32, int8): m.warmup()
+    ref, ref_t = timed(lambda c: float(fp32.predict(c[None])[0]), crops)
+    out, out_t = timed(lambda c: float(int8.predict(c[None])[0]), crops)
+
+    ref, out = np.asarray(ref), np.asarray(out)
+    lat = {"fp32": summarize(ref_t), "int8": summarize(out_t)}
+    return {
+        "crops": int(len(crops)),
+        "latency": lat,
+        "speedup_p50": speedup(lat["fp32"], lat["int8"]),
+        "max_score_diff": round(float(np.max(np.abs(ref - out))), 4),
+        "decision_flips": int(np.sum((ref > PARAMS["FFIRENET_CONF"]) != (out > PARAMS["FFIRENET_CONF"])))
+    }
+
+
+def report_midas(frames):
+    fp32, int8 = (load_depth("onnx", PATHS, quantized=q) for q in (False, True))
+    for m in (fp32, int8): m.warmup()
+    images = [f for _, f in frames]
+    ref, ref_t = timed(fp32.estimate, images)
+    out, out_t = timed(int8.estimate, images)
+
+    # Distances come from box medians, so compare the median over the centre region
+    errors = []
+    for r, o in zip(ref, out):
+        h, w = r.shape
+        region = (slice(h // 4, 3 * h // 4), slice(w // 4, 3 * w // 4))
+        r_med, o_med = float(np.median(r[region])), float(np.median(o[region]))
+        errors.append(abs(r_med - o_med) / max(abs(r_med), 1e-6))
+    lat = {"fp32": summarize(ref_t), "int8": summarize(out_t)}
+    return {
+        "latency": lat,
+        "speedup_p50": speedup(lat["fp32"], lat["int8"]),
+        "median_depth_rel_error": {"mean": round(float(np.mean(errors)), 4), "max": round(float(np.max(errors)), 4)}
+    }
+
+
+def build_report(frames, only, iou_thr):
+    report = {"frames": len(frames)}
+    boxes = [[] for _ in frames]
+    if "yolo" in only:
+        report["yolo"], boxes = report_yolo(frames, iou_thr)
+    if "ffirenet" in only:
+        report["ffirenet"] = report_ffirenet(frames, boxes)
+    if "midas" in only:
+        report["midas"] = report_midas(frames)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=str, default="../FireAdmin/public/captures")
+    parser.add_argument('--only', nargs='+', choices=list(MODELS), default=list(MODELS))
+    parser.add_argument('--mode', choices=["static", "dynamic"], default="static")
+    parser.add_argument('--calibration-frames', type=int, default=100, help="frames used to calibrate activation ranges (static mode)")
+    parser.add_argument('--iou', type=float, default=0.5)
+    parser.add_argument('--report', action='store_true', help="compare FP32 and INT8 after quantizing")
+    parser.add_argument('--report-only', action='store_true', help="skip quantization, only compare existing models")
+    parser.add_argument('--out', type=str, default=None, help="write the report here instead of stdout")
+    args = parser.parse_args()
+
+    frames = load_frames(args.frames)
+    if not frames and (args.mode == "static" or args.report or args.report_only):
+        print(f"No frames found in {args.frames}")
+        sys.exit(1)
+
+    reporting = args.report or args.report_only
+    # Progress and model logs go to stderr when the report is printed, so stdout stays valid JSON
+    with redirect_stdout(sys.stderr if reporting else sys.stdout):
+        if not args.report_only:
+            calib = frames[:args.calibration_frames]
+            for model in args.only:
+                print(f"[Quantize] {model} ({args.mode}, {len(calib)} calibration frames)...")
+                quantize(model, args.mode, calib)
+        report = build_report(frames, args.only, args.iou) if reporting else None
+
+    if reporting:
+        report["mode"] = args.mode
+        output = json.dumps(report, indent=2)
+        if args.out:
+            with open(args.out, "w") as f:
+                f.write(output + "\n")
+            print(f"Report written to {args.out}")
+        else:
+            print(output)
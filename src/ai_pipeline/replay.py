@@ -0,0 +1,186 @@
+"""
+Offline replay / backfill: runs recorded footage through FireDetectionEngine as
+fast as the CPU allows and writes the alerts it would have produced as JSONL
+(one line per frame, with the frame timestamp). Nothing is sent to Orion.
+Frames are decoded on a background thread while the engine works on the previous batch.
+Usage: python replay.py --video clip.mp4 --camera cam1 --out alerts.jsonl [--param YOLO_CONF=0.3]
+       python replay.py --frames ../FireAdmin/public/captures --out alerts.jsonl --changes-only
+"""
+import sys
+import json
+import time
+import queue
+import datetime
+import argparse
+import threading
+from contextlib import redirect_stdout
+
+import ai_pipeline
+from ai_pipeline import FireDetectionEngine, PARAMS, BACKENDS
+from benchmark import STAGES, iter_frames, load_camera_configs, parse_location, peak_rss_mb, summarize
+from scene_gate import SceneChangeGate
+
+DONE = object()
+
+
+def parse_param(text):
+    """KEY=VALUE -> (KEY, value) with the type of the existing PARAMS entry."""
+    key, _, raw = text.partition("=")
+    if key not in PARAMS:
+        raise argparse.ArgumentTypeError(f"unknown PARAMS key {key}")
+    current = PARAMS[key]
+    if isinstance(current, bool):
+        return key, raw.lower() in ("1", "true", "yes", "on")
+    return key, type(current)(raw)
+
+
+def decode_worker(source, camera, max_frames, frames_q, errors):
+    try:
+        for item in iter_frames(source, camera, max_frames):
+            frames_q.put(item)
+    except BaseException as e:
+        errors.append(e)
+    finally:
+        frames_q.put(DONE)
+
+
+def next_batch(frames_q, size):
+    # Blocks for the first frame, then takes whatever is already decoded
+    first = frames_q.get()
+    if first is DONE: return [], True
+    batch = [first]
+    while len(batch) < size:
+        try:
+            item = frames_q.get_nowait()
+        except queue.Empty:
+            break
+        if item is DONE: return batch, True
+        batch.append(item)
+    return batch, False
+
+
+def replay(args, metas, out):
+    engine = FireDetectionEngine(args.backends)
+    engine.timings = {}
+    gate = SceneChangeGate() if args.gate else None
+
+    frames_q = queue.Queue(maxsize=max(2, args.batch * 4))
+    errors = []
+    decoder = threading.Thread(
+        target=decode_worker, args=(args.frames or args.video, args.camera, args.max_frames, frames_q, errors),
+        daemon=True, name="decode"
+    )
+    decoder.start()
+
+    start_time = args.start_time
+    last_severity = {}
+    frame_times = []
+    processed = written = critical = 0
+    started = time.perf_counter()
+
+    done = False
+    while not done:
+        batch, done = next_batch(frames_q, args.batch)
+        if not batch: break
+
+        to_run = [i for i, (cam, frame, _) in enumerate(batch) if gate is None or gate.needs_inference(cam, frame)]
+        t0 = time.perf_counter()
+        results = engine.process_frames([(batch[i][1], batch[i][0], metas.get(batch[i][0])) for i in to_run]) if to_run else []
+        per_frame = (time.perf_counter() - t0) / len(to_run) if to_run else 0.0
+        frame_times += [per_frame] * len(to_run)
+
+        alerts = dict(zip(to_run, results))
+        for i, (cam, _, ts) in enumerate(batch):
+            if i in alerts:
+                if gate is not None: gate.record(cam, alerts[i], per_frame)
+                alert, inferred = alerts[i], True
+            else:
+                alert, inferred = gate.cached_alert(cam), False
+            processed += 1
+
+            severity = alert["severity"]["value"] if alert else None
+            if severity == "critical": critical += 1
+            if args.changes_only and last_severity.get(cam) == severity: continue
+            last_severity[cam] = severity
+
+            record = {"camera": cam, "t": round(ts, 3), "inferred": inferred, "severity": severity, "alert": alert}
+            if start_time is not None:
+                record["timestamp"] = (start_time + datetime.timedelta(seconds=ts)).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+            out.write(json.dumps(record) + "\n")
+            written += 1
+
+    wall = time.perf_counter() - started
+    if errors: raise errors[0]
+
+    timings = dict(engine.timings)
+    timings["frame"] = frame_times
+    return {
+        "source": args.frames or args.video,
+        "frames": processed,
+        "inferred": len(frame_times),
+        "lines_written": written,
+        "critical_frames": critical,
+        "fps": round(processed / wall, 2) if wall > 0 else None,
+        "wall_s": round(wall, 3),
+        "startup": engine.startup_timings,
+        "peak_rss_mb": peak_rss_mb(),
+        "tracker": engine.tracker.stats() if engine.tracker is not None else None,
+        "gate": gate.stats() if gate is not None else None,
+        "stages": {stage: summarize(timings.get(stage, [])) for stage in STAGES},
+        "params": {k: v for k, v in PARAMS.items() if not isinstance(v, (list, dict))}
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    src = parser.add_mutually_exclusive_group(required=True)
+    src.add_argument('--frames', type=str, help="folder of .jpg/.png frames (sorted by name)")
+    src.add_argument('--video', type=str, help="video file")
+    parser.add_argument('--out', type=str, required=True, help="JSONL file for the alerts ('-' for stdout)")
+    parser.add_argument('--configs', type=str, default="../FireAdmin/public/configs", help="calibration + ROI files")
+    parser.add_argument('--camera', type=str, default=None, help="camera id for every frame (defaults to file name)")
+    parser.add_argument('--location', type=str, default=None, help="camera 'lng,lat' so fires get coordinates")
+    parser.add_argument('--rotation', type=float, default=0.0, help="camera rotationAngle in degrees")
+    parser.add_argument('--start-time', type=str, default=None, help="ISO time of the first frame, adds absolute timestamps")
+    parser.add_argument('--max-frames', type=int, default=0)
+    parser.add_argument('--batch', type=int, default=PARAMS["BATCH_MAX_SIZE"])
+    parser.add_argument('--backend', choices=["native", "onnx"], default=None, help="override INFERENCE_BACKEND for all models")
+    parser.add_argument('--gate', action='store_true', help="skip unchanged frames like the live pipeline does")
+    parser.add_argument('--changes-only', action='store_true', help="only write frames whose severity changed for that camera")
+    parser.add_argument('--param', type=parse_param, action='append', default=[], metavar="KEY=VALUE", help="override a PARAMS entry")
+    parser.add_argument('--summary', type=str, default=None, help="write the run summary JSON here (default stderr)")
+    args = parser.parse_args()
+
+    for key, value in args.param:
+        PARAMS[key] = value
+    PARAMS["BATCH_MAX_SIZE"] = max(1, args.batch)
+    args.batch = PARAMS["BATCH_MAX_SIZE"]
+    args.backends = {name: args.backend for name in BACKENDS} if args.backend else None
+    if args.start_time:
+        args.start_time = datetime.datetime.fromisoformat(args.start_time.replace("Z", "+00:00"))
+    # ROI files live next to the calibration files
+    ai_pipeline.ROI_CONFIG_DIR = args.configs
+
+    metas = load_camera_configs(args.configs, parse_location(args.location), args.rotation)
+    if args.camera and args.camera not in metas and args.location:
+        # No calibration file for this camera: geo-project with the engine's fallback constant
+        metas[args.camera] = {
+            "calibrationConstant": {"value": PARAMS["FAKE_CALIBRATION_C"]},
+            "rotationAngle": {"value": args.rotation},
+            "location": {"type": "geo:json", "value": {"type": "Point", "coordinates": list(parse_location(args.location))}}
+        }
+
+    out = sys.stdout if args.out == "-" else open(args.out, "w")
+    try:
+        # Engine logs go to stderr so a '-' output stays valid JSONL
+        with redirect_stdout(sys.stderr):
+            summary = replay(args, metas, out)
+    finally:
+        if out is not sys.stdout: out.close()
+
+    text = json.dumps(summary, indent=2)
+    if args.summary:
+        with open(args.summary, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text, file=sys.stderr)
@@ -0,0 +1,147 @@
+import os
+import re
+import json
+import time
+
+import cv2
+import numpy as np
+
+from fire_tracker import box_iou
+
+ROI_PARAMS = {
+    "TILE_SIZE": 640,          # tile side in frame pixels (YOLO input size, so tiles are not downscaled)
+    "TILE_OVERLAP": 0.2,       # overlap between neighbouring tiles, so a fire on a seam is whole in one of them
+    "MAX_TILES": 16,           # per frame; bigger regions get bigger (downscaled) tiles instead
+    "TILE_BATCH": 16,          # tiles per YOLO forward pass
+    "MERGE_IOU": 0.4,          # boxes from different tiles overlapping this much are merged
+    "MERGE_CONTAIN": 0.7,      # ... or when this much of the smaller box lies inside the other
+    "REFRESH": 30.0            # how often a camera's ROI file is checked for changes (seconds)
+}
+
+
+def safe_name(camera_id):
+    # Same file naming FireAdmin uses for <camera>_config.json
+    return re.sub(r'[^a-zA-Z0-9_-]', '_', camera_id)
+
+
+def grid(start, length, tile, stride):
+    if length <= tile: return [start]
+    steps = int(np.ceil((length - tile) / stride))
+    return [start + min(i * stride, length - tile) for i in range(steps + 1)]
+
+
+def merge_boxes(boxes):
+    """Union of boxes that describe the same fire seen from overlapping tiles."""
+    merged = []
+    for box in sorted(boxes, key=lambda b: (b[2] - b[0]) * (b[3] - b[1]), reverse=True):
+        for i, kept in enumerate(merged):
+            ix = max(0.0, min(box[2], kept[2]) - max(box[0], kept[0]))
+            iy = max(0.0, min(box[3], kept[3]) - max(box[1], kept[1]))
+            smaller = min((box[2] - box[0]) * (box[3] - box[1]), (kept[2] - kept[0]) * (kept[3] - kept[1]))
+            if box_iou(box, kept) >= ROI_PARAMS["MERGE_IOU"] or (smaller > 0 and ix * iy / smaller >= ROI_PARAMS["MERGE_CONTAIN"]):
+                merged[i] = [min(box[0], kept[0]), min(box[1], kept[1]), max(box[2], kept[2]), max(box[3], kept[3])]
+                break
+        else:
+            merged.append(list(box))
+    return merged
+
+
+class RoiTiler:
+    """
+    Per-camera regions of interest from FireAdmin/public/configs/<camera>_roi.json:
+        {"polygons": [[[x, y], [x, y], ...], ...]}
+    in frame pixels, or as 0..1 fractions of width/height with "normalized": true.
+    Only the polygons' bounding rectangles are sent to YOLO, cut into overlapping
+    native-resolution tiles; boxes whose centre falls outside every polygon are dropped.
+    Cameras without a file keep whole-frame detection.
+    """
+
+    def __init__(self, config_dir):
+        self.config_dir = config_dir
+        self.polygons = {}       # camera_id -> (polygons, normalized), None when the camera has no ROI
+        self.mtimes = {}         # camera_id -> mtime of the loaded file
+        self.checked = {}        # camera_id -> monotonic time of the last file check
+        self.layouts = {}        # (camera_id, frame shape) -> (tiles, mask)
+
+    def _path(self, camera_id):
+        return os.path.join(self.config_dir, f"{safe_name(camera_id)}_roi.json")
+
+    def _refresh(self, camera_id):
+        now = time.monotonic()
+        if camera_id in self.checked and now - self.checked[camera_id] < ROI_PARAMS["REFRESH"]:
+            return
+        self.checked[camera_id] = now
+
+        path = self._path(camera_id)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            mtime = None
+        if camera_id in self.mtimes and mtime == self.mtimes[camera_id]:
+            return
+
+        polygons = None
+        if mtime is not None:
+            try:
+                with open(path) as f:
+                    spec = json.load(f)
+                polygons = [np.asarray(p, dtype=np.float32).reshape(-1, 2) for p in spec.get("polygons", [])]
+                polygons = [p for p in polygons if len(p) >= 3]
+                if polygons:
+                    print(f"[ROI] {camera_id}: {len(polygons)} region(s) from {path}")
+                    polygons = (polygons, bool(spec.get("normalized")))
+            except (ValueError, OSError) as e:
+                print(f"Ignoring ROI file {path}: {e}")
+                polygons = None
+
+        self.mtimes[camera_id] = mtime
+        self.polygons[camera_id] = polygons or None
+        for key in [k for k in self.layouts if k[0] == camera_id]:
+            del self.layouts[key]
+
+    def _layout(self, camera_id, shape):
+        key = (camera_id, shape[:2])
+        if key in self.layouts: return self.layouts[key]
+
+        h, w = shape[:2]
+        polygons, normalized = self.polygons[camera_id]
+        scale = np.float32([w, h]) if normalized else np.float32([1, 1])
+        points = [np.clip(np.round(p * scale), 0, [w - 1, h - 1]).astype(np.int32) for p in polygons]
+        mask = np.zeros((h, w), dtype=np.uint8)
+        cv2.fillPoly(mask, points, 1)
+
+        rects = []
+        for p in points:
+            x, y, rw, rh = cv2.boundingRect(p)
+            if rw > 0 and rh > 0: rects.append((x, y, rw, rh))
+
+        # Grow the tile until the regions fit in MAX_TILES
+        tile = ROI_PARAMS["TILE_SIZE"]
+        while True:
+            stride = max(1, int(tile * (1 - ROI_PARAMS["TILE_OVERLAP"])))
+            tiles = []
+            for x, y, rw, rh in rects:
+                for ty in grid(y, rh, tile, stride):
+                    for tx in grid(x, rw, tile, stride):
+                        tiles.append((tx, ty, min(tx + tile, x + rw), min(ty + tile, y + rh)))
+            if len(tiles) <= ROI_PARAMS["MAX_TILES"] or tile >= max(w, h): break
+            tile = int(tile * 1.5)
+
+        self.layouts[key] = (tiles, mask)
+        return tiles, mask
+
+    def tiles(self, camera_id, frame):
+        """[(x1, y1, x2, y2)] to run YOLO on, or None for the whole frame."""
+        self._refresh(camera_id)
+        if not self.polygons.get(camera_id): return None
+        return self._layout(camera_id, frame.shape)[0]
+
+    def keep(self, camera_id, frame, boxes):
+        """Full-frame boxes -> merged boxes whose centre lies inside the camera's ROI."""
+        mask = self._layout(camera_id, frame.shape)[1]
+        h, w = mask.shape
+        inside = [
+            b for b in boxes
+            if mask[min(h - 1, max(0, int((b[1] + b[3]) / 2))), min(w - 1, max(0, int((b[0] + b[2]) / 2)))]
+        ]
+        return merge_boxes(inside)
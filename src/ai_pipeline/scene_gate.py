@@ -0,0 +1,95 @@
+import time
+
+import cv2
+import numpy as np
+
+GATE_PARAMS = {
+    "ENABLED": True,
+    "THUMB_SIZE": (64, 48),       # downscaled grayscale used for differencing
+    "PIXEL_DELTA": 18,            # grey-level change that counts a thumbnail pixel as changed
+    "CHANGED_FRACTION": 0.005,    # share of changed pixels that wakes the engine up
+    "FORCE_INTERVAL": 10.0,       # full pass at least this often per camera (seconds)
+    "REPORT_INTERVAL": 60.0       # how often the skip statistics are printed
+}
+
+
+def thumbnail(frame, size=None):
+    small = cv2.resize(frame, size or GATE_PARAMS["THUMB_SIZE"], interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    return small
+
+def changed_fraction(thumb, reference, pixel_delta=None):
+    diff = cv2.absdiff(thumb, reference)
+    return np.count_nonzero(diff > (pixel_delta or GATE_PARAMS["PIXEL_DELTA"])) / diff.size
+
+
+class SceneChangeGate:
+    """
+    Cheap per-camera change detector in front of FireDetectionEngine.
+    Each frame is shrunk to a small grayscale thumbnail and compared with the
+    thumbnail of the last frame that went through full inference. Unchanged
+    scenes reuse the previous alert instead of running YOLO/FFireNet/MiDaS.
+    """
+
+    def __init__(self):
+        self.references = {}     # camera_id -> thumbnail of the last inferred frame
+        self.last_run = {}       # camera_id -> monotonic time of the last full pass
+        self.alerts = {}         # camera_id -> alert produced by the last full pass
+        self.cost = {}           # camera_id -> moving average of full inference time (s)
+
+        self.frames = 0
+        self.skipped = 0
+        self.time_saved = 0.0
+        self._last_report = time.monotonic()
+
+    def needs_inference(self, camera_id, frame):
+        self.frames += 1
+        thumb = thumbnail(frame)
+        now = time.monotonic()
+
+        reference = self.references.get(camera_id)
+        run = (
+            not GATE_PARAMS["ENABLED"]
+            or reference is None
+            or reference.shape != thumb.shape
+            or camera_id not in self.alerts
+            or now - self.last_run.get(camera_id, 0.0) >= GATE_PARAMS["FORCE_INTERVAL"]
+        )
+        if not run:
+            run = changed_fraction(thumb, reference) >= GATE_PARAMS["CHANGED_FRACTION"]
+
+        if run:
+            self.references[camera_id] = thumb
+            self.last_run[camera_id] = now
+        else:
+            self.skipped += 1
+            self.time_saved += self.cost.get(camera_id, 0.0)
+        return run
+
+    def record(self, camera_id, alert, elapsed):
+        self.alerts[camera_id] = alert
+        prev = self.cost.get(camera_id)
+        self.cost[camera_id] = elapsed if prev is None else 0.8 * prev + 0.2 * elapsed
+
+    def cached_alert(self, camera_id):
+        return self.alerts.get(camera_id)
+
+    def forget(self, camera_id):
+        for table in (self.references, self.last_run, self.alerts, self.cost):
+            table.pop(camera_id, None)
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "skipped": self.skipped,
+            "skip_rate": round(self.skipped / self.frames, 3) if self.frames else 0.0,
+            "time_saved_s": round(self.time_saved, 2)
+        }
+
+    def report(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_report < GATE_PARAMS["REPORT_INTERVAL"]: return
+        self._last_report = now
+        s = self.stats()
+        print(f"[Gate] skipped {s['skipped']}/{s['frames']} frames ({s['skip_rate']:.0%}), ~{s['time_saved_s']}s of inference saved")
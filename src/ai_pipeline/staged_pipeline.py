@@ -0,0 +1,296 @@
+import time
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from frame_grabber import GRABBER_PARAMS
+
+STAGE_PARAMS = {
+    "QUEUE_SIZE": 16,          # max cameras waiting in front of each stage
+    "FETCH_CONCURRENCY": 2,    # parallel Camera Service requests (HTTP ingest, sequential mode too)
+    "GRABBER_POLL": 0.02,      # how often in-process grabbers are checked for new frames
+    "PUBLISH_BATCH": 64,
+    "PUBLISH_WAIT": 0.2,
+    "REPORT_INTERVAL": 30.0
+}
+
+
+class LatestPerCameraQueue:
+    """
+    Bounded queue holding at most one item per camera.
+    A newer frame replaces the queued one for the same camera, and when the
+    queue is full the oldest camera's item is dropped, so producers never block
+    and consumers always work on fresh frames.
+    """
+
+    def __init__(self, name, maxsize, on_drop=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.on_drop = on_drop
+        self.items = OrderedDict()
+        self.dropped = 0
+        self._ready = asyncio.Event()
+
+    def __len__(self):
+        return len(self.items)
+
+    def put(self, camera_id, item):
+        if camera_id in self.items:
+            del self.items[camera_id]
+            self.dropped += 1
+        elif len(self.items) >= self.maxsize:
+            old_id, _ = self.items.popitem(last=False)
+            self.dropped += 1
+            if self.on_drop: self.on_drop(old_id)
+        self.items[camera_id] = item
+        self._ready.set()
+
+    async def get(self):
+        while not self.items:
+            self._ready.clear()
+            await self._ready.wait()
+        return self.items.popitem(last=False)
+
+    async def get_batch(self, max_size, max_wait):
+        # First item blocks, the rest are collected until max_size or the deadline
+        batch = [await self.get()]
+        deadline = time.monotonic() + max_wait
+        while len(batch) < max_size:
+            if self.items:
+                batch.append(self.items.popitem(last=False))
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0: break
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+
+class StageStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.ema = None
+        self.max = 0.0
+
+    def add(self, elapsed, n=1):
+        self.count += n
+        self.total += elapsed
+        per_item = elapsed / n
+        self.ema = per_item if self.ema is None else 0.9 * self.ema + 0.1 * per_item
+        self.max = max(self.max, per_item)
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "avg_ms": round(1000 * self.total / self.count, 1) if self.count else None,
+            "ema_ms": round(1000 * self.ema, 1) if self.ema is not None else None,
+            "max_ms": round(1000 * self.max, 1)
+        }
+
+
+class FrameItem:
+    __slots__ = ("camera_id", "frame", "meta", "acquired", "candidates", "cost")
+
+    def __init__(self, camera_id, frame, meta):
+        self.camera_id = camera_id
+        self.frame = frame
+        self.meta = meta
+        self.acquired = time.monotonic()
+        self.candidates = None
+        self.cost = 0.0
+
+
+class StagedPipeline:
+    """
+    acquire -> decode -> detect (YOLO, batched) -> verify/depth -> publish,
+    each stage its own task linked by LatestPerCameraQueue.
+    Models run in a single inference thread, network and JPEG decoding in an
+    I/O pool, so a slow HTTP call never stalls inference.
+    """
+
+    def __init__(self, engine, gate, publisher, params, fetch_payload=None, decode_payload=None, grabber_pool=None, scheduler=None, next_target=None):
+        self.engine = engine
+        self.gate = gate
+        self.publisher = publisher
+        self.params = params
+        self.fetch_payload = fetch_payload
+        self.decode_payload = decode_payload
+        self.grabber_pool = grabber_pool
+        self.scheduler = scheduler
+        self.next_target = next_target     # exclude -> (url, meta, camera_id), picks the camera for fetch_payload
+
+        self.infer_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        self.io_pool = ThreadPoolExecutor(max_workers=STAGE_PARAMS["FETCH_CONCURRENCY"] + 2, thread_name_prefix="io")
+        self.stats = {name: StageStats() for name in ("acquire", "decode", "detect", "verify", "publish", "end_to_end")}
+        # Grabber frames are leased zero-copy, so a camera has at most one frame in flight
+        self.in_flight = set()
+        self.fetching = set()     # cameras with a Camera Service request running
+
+    def _release(self, camera_id):
+        self.in_flight.discard(camera_id)
+
+    def _ring_live(self):
+        # In-process grabbers have no heartbeat; a shared-memory ring goes stale when its writer stops
+        heartbeat_age = getattr(self.grabber_pool, "heartbeat_age", None)
+        return heartbeat_age is None or heartbeat_age() < GRABBER_PARAMS["STALE_AFTER"]
+
+    async def _run(self, pool, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+
+    # --- STAGES ---
+
+    async def fetch_loop(self):
+        while True:
+            if self.grabber_pool is not None and self._ring_live():
+                # HTTP is only the fallback while the frame ring is stale
+                await asyncio.sleep(self.params["POLL_INTERVAL"])
+                continue
+            started = time.monotonic()
+            # Picked on the loop thread, so two fetch loops never request the same camera at once
+            target = self.next_target(self.fetching) if self.next_target is not None else None
+            if target is not None and target[0] is None:
+                await asyncio.sleep(self.params["POLL_INTERVAL"])
+                continue
+            camera_id = target[2] if target is not None else None
+            if camera_id is not None: self.fetching.add(camera_id)
+            try:
+                data = await self._run(self.io_pool, self.fetch_payload, target)
+            finally:
+                self.fetching.discard(camera_id)
+            if data is None:
+                await asyncio.sleep(self.params["POLL_INTERVAL"])
+                continue
+            self.stats["acquire"].add(time.monotonic() - started)
+            self.decode_q.put(data.get("id", "unknown"), data)
+
+    async def grabber_loop(self):
+        while True:
+            if not self._ring_live():
+                await asyncio.sleep(STAGE_PARAMS["GRABBER_POLL"])
+                continue
+            started = time.monotonic()
+            exclude = self.in_flight | self.scheduler.held_back() if self.scheduler is not None else self.in_flight
+            batch = self.grabber_pool.next_batch(STAGE_PARAMS["QUEUE_SIZE"], exclude=exclude)
+            for frame, camera_id, meta in batch:
+                self.in_flight.add(camera_id)
+                if self.scheduler is not None: self.scheduler.record_sample(camera_id)
+                self.detect_q.put(camera_id, FrameItem(camera_id, frame, meta))
+            if batch: self.stats["acquire"].add(time.monotonic() - started, len(batch))
+            await asyncio.sleep(STAGE_PARAMS["GRABBER_POLL"])
+
+    async def decode_stage(self):
+        while True:
+            camera_id, data = await self.decode_q.get()
+            started = time.monotonic()
+            try:
+                decoded = await self._run(self.io_pool, self.decode_payload, data)
+            except Exception as e:
+                print(f"Error decoding camera frame: {e}")
+                continue
+            if decoded is None: continue
+            self.stats["decode"].add(time.monotonic() - started)
+            frame, camera_id, meta = decoded
+            self.detect_q.put(camera_id, FrameItem(camera_id, frame, meta))
+
+    async def detect_stage(self):
+        while True:
+            batch = await self.detect_q.get_batch(self.params["BATCH_MAX_SIZE"], self.params["BATCH_MAX_WAIT"])
+            to_run = []
+            for camera_id, item in batch:
+                if self.gate.needs_inference(camera_id, item.frame):
+                    to_run.append(item)
+                else:
+                    self.publish_q.put(camera_id, (item, self.gate.cached_alert(camera_id)))
+            if not to_run: continue
+
+            started = time.monotonic()
+            try:
+                detections = await self._run(
+                    self.infer_pool, self.engine._detect_candidates,
+                    [item.frame for item in to_run], [item.camera_id for item in to_run]
+                )
+            except Exception as e:
+                print(f"Error in detection stage: {e}")
+                for item in to_run: self._release(item.camera_id)
+                continue
+            elapsed = time.monotonic() - started
+            self.stats["detect"].add(elapsed, len(to_run))
+
+            for item, candidates in zip(to_run, detections):
+                item.candidates = candidates
+                item.cost = elapsed / len(to_run)
+                self.verify_q.put(item.camera_id, item)
+
+    async def verify_stage(self):
+        while True:
+            camera_id, item = await self.verify_q.get()
+            started = time.monotonic()
+            try:
+                alert = await self._run(self.infer_pool, self.engine._verify_candidates, item.frame, item.candidates, camera_id, item.meta)
+            except Exception as e:
+                print(f"Error in verification stage: {e}")
+                self._release(camera_id)
+                continue
+            elapsed = time.monotonic() - started
+            self.stats["verify"].add(elapsed)
+            self.gate.record(camera_id, alert, item.cost + elapsed)
+            if self.scheduler is not None:
+                self.scheduler.observe(camera_id, alert, self.engine.candidate_counts.get(camera_id, 0))
+            self.publish_q.put(camera_id, (item, alert))
+
+    async def publish_stage(self):
+        while True:
+            batch = await self.publish_q.get_batch(STAGE_PARAMS["PUBLISH_BATCH"], STAGE_PARAMS["PUBLISH_WAIT"])
+            now = time.monotonic()
+            for camera_id, (item, alert) in batch:
+                self._release(camera_id)
+                self.stats["end_to_end"].add(now - item.acquired)
+                if alert is not None: self.publisher.submit(alert)
+
+            started = time.monotonic()
+            await self._run(self.io_pool, self.publisher.flush)
+            self.stats["publish"].add(time.monotonic() - started, len(batch))
+
+    # --- METRICS ---
+
+    def metrics(self):
+        return {
+            "queues": {q.name: {"depth": len(q), "dropped": q.dropped} for q in self.queues},
+            "stages": {name: s.as_dict() for name, s in self.stats.items()},
+            "gate": self.gate.stats(),
+            "tracker": self.engine.tracker.stats() if self.engine.tracker is not None else None,
+            "sampling": self.scheduler.rates() if self.scheduler is not None else None
+        }
+
+    async def report_loop(self):
+        while True:
+            await asyncio.sleep(STAGE_PARAMS["REPORT_INTERVAL"])
+            m = self.metrics()
+            queues = ", ".join(f"{n} {q['depth']} (-{q['dropped']})" for n, q in m["queues"].items())
+            stages = ", ".join(f"{n} {s['ema_ms']}ms" for n, s in m["stages"].items() if s["count"])
+            print(f"[Pipeline] queues: {queues} | latency: {stages}")
+            self.gate.report()
+            if self.scheduler is not None: self.scheduler.report()
+
+    async def run(self):
+        size = STAGE_PARAMS["QUEUE_SIZE"]
+        self.decode_q = LatestPerCameraQueue("decode", size)
+        self.detect_q = LatestPerCameraQueue("detect", size, on_drop=self._release)
+        self.verify_q = LatestPerCameraQueue("verify", size, on_drop=self._release)
+        self.publish_q = LatestPerCameraQueue("publish", size * 4, on_drop=self._release)
+        self.queues = [self.decode_q, self.detect_q, self.verify_q, self.publish_q]
+
+        tasks = [self.detect_stage(), self.verify_stage(), self.publish_stage(), self.report_loop()]
+        if self.grabber_pool is not None:
+            tasks.append(self.grabber_loop())
+        if self.grabber_pool is None or hasattr(self.grabber_pool, "heartbeat_age"):
+            # Camera Service over HTTP; next to a frame ring it takes over while the ring is stale
+            tasks.append(self.decode_stage())
+            tasks += [self.fetch_loop() for _ in range(STAGE_PARAMS["FETCH_CONCURRENCY"])]
+
+        print(f"[Pipeline] staged mode, queue size {size}")
+        await asyncio.gather(*tasks)
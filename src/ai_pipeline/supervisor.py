@@ -0,0 +1,120 @@
+import os
+import time
+import bisect
+import hashlib
+import threading
+import multiprocessing as mp
+
+from frame_grabber import GRABBER_PARAMS
+
+SUPERVISOR_PARAMS = {
+    "VIRTUAL_NODES": 64,      # ring points per worker, evens out the camera split
+    "RESTART_DELAY": 5.0      # pause before replacing a crashed worker
+}
+
+
+def _hash(key):
+    return int(hashlib.md5(key.encode("utf-8")).hexdigest()[:16], 16)
+
+
+class HashRing:
+    """
+    Consistent hash ring: adding or removing a camera only moves that camera,
+    and changing the worker count only moves ~1/K of the cameras.
+    """
+
+    def __init__(self, workers, virtual_nodes=None):
+        vnodes = virtual_nodes or SUPERVISOR_PARAMS["VIRTUAL_NODES"]
+        points = sorted((_hash(f"worker-{w}#{v}"), w) for w in workers for v in range(vnodes))
+        self._keys = [p for p, _ in points]
+        self._owners = [w for _, w in points]
+
+    def owner(self, camera_id):
+        i = bisect.bisect(self._keys, _hash(camera_id)) % len(self._keys)
+        return self._owners[i]
+
+    def split(self, registry, count):
+        shares = [{} for _ in range(count)]
+        for camera_id, entry in registry.items():
+            shares[self.owner(camera_id)][camera_id] = entry
+        return shares
+
+
+def _follow_assignments(pipeline, assignments):
+    while True:
+        share = assignments.get()
+        pipeline.set_camera_shard(share)
+        print(f"[Worker] now handling {len(share)} cameras")
+
+
+def worker_main(index, assignments):
+    # Imported here so each spawned process builds its own engine and runtimes
+    import ai_pipeline as pipeline
+
+    print(f"[Worker {index}] pid {os.getpid()}, {os.environ.get('INFERENCE_THREADS')} inference threads")
+    pipeline.set_camera_shard(assignments.get())
+    pipeline.engine = pipeline.FireDetectionEngine()
+    threading.Thread(target=_follow_assignments, args=(pipeline, assignments), daemon=True).start()
+    pipeline.start_monitoring()
+
+
+def _prepare_shared_weights(paths, backends):
+    # Only ONNX Runtime can run on externally owned weight buffers
+    from backends import SHARED_WEIGHTS_DIR, export_shared_weights
+    if not SHARED_WEIGHTS_DIR: return
+    for model, backend in backends.items():
+        path = paths.get(f"{model}_ONNX")
+        if backend != "onnx" or not path or not os.path.exists(path): continue
+        try:
+            export_shared_weights(path)
+            print(f"[Supervisor] {model} weights shared from {SHARED_WEIGHTS_DIR}")
+        except Exception as e:
+            print(f"[Supervisor] Could not share {model} weights ({e}), workers load their own copy")
+
+
+def run_supervisor(workers, load_registry, paths, backends):
+    # spawn, not fork: TensorFlow, torch and ORT thread pools do not survive a fork
+    ctx = mp.get_context("spawn")
+    # Split the cores between the workers; spawned children inherit this at start
+    os.environ["INFERENCE_THREADS"] = str(max(1, (os.cpu_count() or 1) // workers))
+    _prepare_shared_weights(paths, backends)
+
+    ring = HashRing(range(workers))
+    queues = [ctx.Queue() for _ in range(workers)]
+    procs = [None] * workers
+    shares = [None] * workers
+
+    def start(i):
+        procs[i] = ctx.Process(target=worker_main, args=(i, queues[i]), name=f"fire-worker-{i}", daemon=True)
+        procs[i].start()
+        if shares[i] is not None: queues[i].put(shares[i])
+
+    print(f"[Supervisor] starting {workers} workers")
+    for i in range(workers):
+        start(i)
+
+    while True:
+        try:
+            registry = load_registry()
+        except Exception as e:
+            print(f"[Supervisor] Camera registry fetch failed: {e}")
+            registry = None
+
+        if registry is not None:
+            for i, share in enumerate(ring.split(registry, workers)):
+                if share != shares[i]:
+                    added = len(set(share) - set(shares[i] or {}))
+                    removed = len(set(shares[i] or {}) - set(share))
+                    print(f"[Supervisor] worker {i}: {len(share)} cameras (+{added} / -{removed})")
+                    shares[i] = share
+                    queues[i].put(share)
+
+        deadline = time.monotonic() + GRABBER_PARAMS["REGISTRY_REFRESH"]
+        while time.monotonic() < deadline:
+            for i, proc in enumerate(procs):
+                if not proc.is_alive():
+                    print(f"[Supervisor] worker {i} exited ({proc.exitcode}), restarting")
+                    time.sleep(SUPERVISOR_PARAMS["RESTART_DELAY"])
+                    queues[i] = ctx.Queue()
+                    start(i)
+            time.sleep(1.0)
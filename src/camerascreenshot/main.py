@@ -1,10 +1,17 @@
 import os
+import sys
+import time
 import ffmpeg
 import requests
 import base64
+import threading
 from fastapi import FastAPI, HTTPException
 from urllib.parse import unquote
 
+# frame_ring.py lives in src/shared, the Docker build copies it next to this file
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+from frame_ring import FrameRingWriter
+
 app = FastAPI()
 
 # FIWARE Orion Context Broker details
@@ -13,123 +20,221 @@ fiware_service = os.getenv("FIWARE_SERVICE")
 fiware_service_path = os.getenv("FIWARE_SERVICE_PATH")
 entity_query = "?type=Camera"
 
+# Shared-memory frame ring for an ai_pipeline on the same host (INGEST_MODE=shm), off when unset
+FRAME_RING = os.getenv("FRAME_RING", "")
+FRAME_RING_SLOTS = int(os.getenv("FRAME_RING_SLOTS", "8"))
+# Frames are scaled down to fit, which also bounds the ring size (slots * width * height * 3)
+FRAME_RING_MAX_SIZE = tuple(int(v) for v in os.getenv("FRAME_RING_MAX_SIZE", "1920x1080").split("x"))
+
 # Build helpers
 RTSP_STREAMS = []
 CAMERA_BY_ID = {}
 cameras = None
+cameras_loaded_at = 0.0
+CAMERA_REFRESH = 60.0   # seconds before the camera list is re-read from Orion
 
 def updateCameras():
-    global cameras, RTSP_STREAMS, CAMERA_BY_ID
-
-    RTSP_STREAMS = []
-    CAMERA_BY_ID = {}
-    cameras = None
+    global cameras, RTSP_STREAMS, CAMERA_BY_ID, cameras_loaded_at
 
     response = requests.get(
         orion_url + entity_query,
         headers={
             "Accept": "application/json",
             "Fiware-ServicePath": fiware_service_path
-        }
+        },
+        timeout=10
     )
 
-    cameras = response.json()
-    for camera in cameras:
-        rtsp = unquote(camera["rtspUrl"]["value"])
-        RTSP_STREAMS.append(rtsp)
-        CAMERA_BY_ID[camera["id"]] = {
-            "name": camera.get("name"),
-            "rtsp": rtsp,
-            "location": camera.get("location"),
-            "rotationAngle": camera.get("rotationAngle"),
-            "calibrationConstant": camera.get("calibrationConstant")
-        }
+    entities = response.json()
+    if not isinstance(entities, list):
+        raise ValueError(f"unexpected camera list from Orion: {str(entities)[:200]}")
+
+    # Built in locals and published at the end: request threads never see a
+    # half-filled list. Readers use only one of these globals each, so they stay consistent
+    fresh, streams, by_id = [], [], {}
+    for camera in entities:
+        try:
+            rtsp = unquote(camera["rtspUrl"]["value"])
+        except (KeyError, TypeError):
+            print(f"Skipping camera without rtspUrl: {camera.get('id') if isinstance(camera, dict) else camera}")
+            continue
+        fresh.append(camera)
+        streams.append(rtsp)
+        by_id[camera["id"]] = (rtsp, camera)
+
+    cameras, RTSP_STREAMS, CAMERA_BY_ID = fresh, streams, by_id
+    cameras_loaded_at = time.monotonic()
 
 updateCameras()
 print(RTSP_STREAMS)
 
 
-def jpg_to_base64(path="screenshot.jpg"):
-    with open(path, "rb") as f:
-        return base64.b64encode(f.read()).decode("utf-8")
+def jpg_to_base64(data):
+    return base64.b64encode(data).decode("utf-8")
+
+
+def grab_jpeg(rtsp_url):
+    """One keyframe as JPEG bytes. ffmpeg writes to a pipe, so concurrent requests never share a file."""
+    out, _ = (
+        ffmpeg
+        .input(
+            rtsp_url,
+            rtsp_transport="tcp"
+        )
+        .output(
+            "pipe:",
+            vframes=1,
+            format="image2",
+            vcodec="mjpeg",
+            vf="select=eq(pict_type\\,I),format=yuv420p"
+        )
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+    if not out:
+        raise ffmpeg.Error("ffmpeg", out, b"no frame decoded")
+    return out
 
 
 idx = 0
+idx_lock = threading.Lock()   # FastAPI runs these sync endpoints on a threadpool
+
+
+def camera_response(camera, img):
+    # Same shape from both endpoints; attributes the entity does not have are left out
+    response = {"id": camera["id"], "name": camera.get("name"), "img": jpg_to_base64(img)}
+    for key in ("location", "rotationAngle", "calibrationConstant"):
+        if camera.get(key) is not None:
+            response[key] = camera[key]
+    return response
 
 
 @app.get("/screenshot/")
 def screenshot_round_robin():
     global idx
 
-    if not RTSP_STREAMS:
+    # One snapshot of the list, a refresh may replace it meanwhile
+    cams = cameras
+    if not cams:
         raise HTTPException(status_code=404, detail="No cameras available")
 
-    i = idx % len(RTSP_STREAMS)
-    rtsp_url = RTSP_STREAMS[i]
-
-    try:
-        (
-            ffmpeg
-            .input(
-                rtsp_url,
-                rtsp_transport="tcp"
-            )
-            .output(
-                "screenshot.jpg",
-                vframes=1,
-                vf="select=eq(pict_type\\,I),format=yuv420p",
-                **{"update": 1}
-            )
-            .run(overwrite_output=True)
-        )
-
-        camera = cameras[i]
+    with idx_lock:
+        camera = cams[idx % len(cams)]
         idx += 1
 
-        return {
-            "id": camera["id"],
-            "name": camera.get("name"),
-            "img": jpg_to_base64(),
-            "location": camera.get("location"),
-            "rotationAngle": camera.get("rotationAngle"),
-            "calibrationConstant": camera.get("calibrationConstant")
-        }
+    try:
+        img = grab_jpeg(unquote(camera["rtspUrl"]["value"]))
+        return camera_response(camera, img)
 
     except ffmpeg.Error as e:
-        idx += 1
         return {"error": e.stderr.decode()}
 
 
 @app.get("/screenshot/{camera_id}")
 def screenshot_by_id(camera_id: str):
-    updateCameras()
-    if camera_id not in CAMERA_BY_ID:
+    # The AI pipeline's scheduler polls this endpoint, so only go back to Orion for unknown ids or a stale list
+    if camera_id not in CAMERA_BY_ID or time.monotonic() - cameras_loaded_at >= CAMERA_REFRESH:
+        try:
+            updateCameras()
+        except Exception as e:
+            print(f"Camera refresh failed: {e}")
+    # Single lookup, the dict may be replaced by another request's refresh at any time
+    entry = CAMERA_BY_ID.get(camera_id)
+    if entry is None:
         raise HTTPException(status_code=404, detail="Camera ID not found")
-
-    camera = CAMERA_BY_ID[camera_id]
-    rtsp_url = camera["rtsp"]
+    rtsp_url, camera = entry
 
     try:
-        (
-            ffmpeg
-            .input(
-                rtsp_url,
-                rtsp_transport="tcp"
-            )
-            .output(
-                "screenshot.jpg",
-                vframes=1,
-                vf="select=eq(pict_type\\,I),format=yuv420p",
-                **{"update": 1}
-            )
-            .run(overwrite_output=True)
-        )
-
-        return {
-            "id": camera_id,
-            "name": camera["name"],
-            "img": jpg_to_base64()
-        }
+        img = grab_jpeg(rtsp_url)
+        return camera_response(camera, img)
 
     except ffmpeg.Error as e:
         return {"error": e.stderr.decode()}
+
+
+# --- SHARED-MEMORY RING ---
+
+frame_sizes = {}   # rtsp url -> (width, height) written to the ring
+
+
+def ring_frame_size(rtsp_url):
+    if rtsp_url not in frame_sizes:
+        probe = ffmpeg.probe(rtsp_url, rtsp_transport="tcp")
+        video = next(s for s in probe["streams"] if s.get("codec_type") == "video")
+        w, h = int(video["width"]), int(video["height"])
+        max_w, max_h = FRAME_RING_MAX_SIZE
+        scale = min(1.0, max_w / w, max_h / h)
+        frame_sizes[rtsp_url] = (int(w * scale) // 2 * 2, int(h * scale) // 2 * 2)
+    return frame_sizes[rtsp_url]
+
+
+def grab_raw_frame(rtsp_url):
+    """One keyframe as raw BGR bytes, decoded by ffmpeg straight into a pipe."""
+    w, h = ring_frame_size(rtsp_url)
+    out, _ = (
+        ffmpeg
+        .input(rtsp_url, rtsp_transport="tcp")
+        .output(
+            "pipe:",
+            vframes=1,
+            format="rawvideo",
+            pix_fmt="bgr24",
+            vf=f"select=eq(pict_type\\,I),scale={w}:{h}"
+        )
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+    return out, w, h
+
+
+def ring_writer_loop(writer):
+    i = 0
+    while True:
+        if time.monotonic() - cameras_loaded_at >= CAMERA_REFRESH:
+            try:
+                updateCameras()
+            except Exception as e:
+                print(f"[FrameRing] camera refresh failed: {e}")
+
+        # Local snapshot: request threads may refresh the camera list at any time
+        cams = cameras
+        if not cams or not isinstance(cams, list):
+            writer.heartbeat()
+            time.sleep(1.0)
+            continue
+
+        camera = cams[i % len(cams)]
+        i += 1
+        rtsp_url = None
+        try:
+            rtsp_url = unquote(camera["rtspUrl"]["value"])
+            pixels, w, h = grab_raw_frame(rtsp_url)
+            if len(pixels) != w * h * 3:
+                raise ValueError(f"expected {w}x{h} frame, got {len(pixels)} bytes")
+            location = (camera.get("location") or {}).get("value", {}).get("coordinates")
+            writer.write(
+                camera["id"], pixels, h, w,
+                location=location,
+                rotation=(camera.get("rotationAngle") or {}).get("value"),
+                calibration=(camera.get("calibrationConstant") or {}).get("value")
+            )
+        except Exception as e:
+            # Never let one bad camera entity or stream end the writer thread
+            frame_sizes.pop(rtsp_url, None)
+            writer.heartbeat()
+            camera_id = camera.get("id") if isinstance(camera, dict) else camera
+            print(f"[FrameRing] {camera_id}: {e.stderr.decode()[-200:] if isinstance(e, ffmpeg.Error) and e.stderr else repr(e)}")
+
+
+@app.on_event("startup")
+def start_frame_ring():
+    if not FRAME_RING: return
+    max_w, max_h = FRAME_RING_MAX_SIZE
+    writer = FrameRingWriter(FRAME_RING, FRAME_RING_SLOTS, max_w * max_h * 3)
+    app.state.frame_ring = writer
+    threading.Thread(target=ring_writer_loop, args=(writer,), daemon=True, name="frame-ring").start()
+    print(f"[FrameRing] writing up to {max_w}x{max_h} frames to /dev/shm/{FRAME_RING} ({FRAME_RING_SLOTS} slots)")
+
+
+@app.on_event("shutdown")
+def stop_frame_ring():
+    writer = getattr(app.state, "frame_ring", None)
+    if writer is not None: writer.close()
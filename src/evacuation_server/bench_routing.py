@@ -0,0 +1,169 @@
+"""
+Routing benchmark + equivalence check for the evacuation server.
+Builds random requests on the shipped map (exits, doors, fires, radar load)
+and times the per door x exit nx.shortest_path loop the server used to run,
+one networkx multi-source Dijkstra, RouteOverlay.exit_tree and CsrRouter.
+Every CSR door path is checked against networkx (identical, or an equal
+cost tie); exits non-zero when one differs.
+Run from this folder (needs map.osm): python bench_routing.py [--doors 200] [--out bench.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+import networkx as nx
+
+os.environ.setdefault("ROUTING_ENGINE", "csr")
+import evacuation_server as server
+from route_overlay import RouteOverlay, exit_path
+
+INF = float("inf")
+
+
+def summarize(samples):
+    ms = np.asarray(samples) * 1000.0
+    return {
+        "count": int(ms.size),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "max_ms": round(float(ms.max()), 3)
+    }
+
+
+def make_request(rng, args):
+    snapshot = server.SNAPSHOT
+    nodes = rng.choice(snapshot.node_count, size=args.exits + args.doors + args.fires, replace=False)
+    ids = snapshot.node_ids[nodes].tolist()
+    exits, doors = ids[:args.exits], ids[args.exits:args.exits + args.doors]
+    fire_nodes = nodes[args.exits + args.doors:]
+    fires = list(zip(snapshot.node_lat[fire_nodes].tolist(), snapshot.node_lon[fire_nodes].tolist()))
+
+    overlay = RouteOverlay(snapshot)
+    server.apply_fire_risk_projected(overlay, fires)
+    busy = rng.choice(snapshot.edge_count, size=min(args.loaded_edges, snapshot.edge_count), replace=False)
+    overlay.add_load(busy, rng.uniform(0, 200, size=len(busy)))
+    return overlay, exits, doors
+
+
+def path_cost(overlay, path):
+    return sum(overlay.cost(e) for e in overlay.path_edges(server.G, path))
+
+
+def pairwise(overlay, exits, doors):
+    # What the server did before: one search per door and exit, keep the cheapest
+    out = {}
+    for door in doors:
+        best_path, best_cost = None, INF
+        for target in exits:
+            try:
+                path = nx.shortest_path(server.G, door, target, weight=overlay.weight)
+            except nx.NetworkXNoPath:
+                continue
+            cost = path_cost(overlay, path)
+            if cost < best_cost:
+                best_path, best_cost = path, cost
+        out[door] = best_path
+    return out
+
+
+def networkx_tree(overlay, exits, doors):
+    def weight(u, v, d):
+        cost = overlay.cost(d['eid'])
+        return None if cost == INF else cost      # None hides the edge from networkx
+    _, paths = nx.multi_source_dijkstra(server.G.reverse(copy=False), set(exits), weight=weight)
+    return {door: paths[door][::-1] if door in paths else None for door in doors}
+
+
+def overlay_tree(overlay, exits, doors):
+    next_hop = overlay.exit_tree(server.G, exits)
+    return {door: exit_path(next_hop, door) for door in doors}
+
+
+def csr_tree(overlay, exits, doors):
+    router = server.CSR_ROUTER
+    next_hop = router.exit_tree(overlay, exits)
+    return {door: router.exit_path(next_hop, door) for door in doors}
+
+
+def compare(overlay, reference, candidate):
+    counts = {"identical": 0, "equal_cost": 0, "different": 0}
+    for door, ref in reference.items():
+        got = candidate[door]
+        if got == ref:
+            counts["identical"] += 1
+        elif got and ref and np.isclose(path_cost(overlay, got), path_cost(overlay, ref), rtol=1e-9, atol=1e-6):
+            counts["equal_cost"] += 1
+        else:
+            counts["different"] += 1
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--exits', type=int, default=4)
+    parser.add_argument('--doors', type=int, default=200)
+    parser.add_argument('--fires', type=int, default=2)
+    parser.add_argument('--loaded-edges', type=int, default=100, help="edges given random radar load")
+    parser.add_argument('--pairwise-doors', type=int, default=20, help="doors timed with the old door x exit loop (slow)")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', type=str, default=None)
+    args = parser.parse_args()
+
+    if server.CSR_ROUTER is None:
+        sys.exit("ROUTING_ENGINE must be 'csr' for the benchmark")
+
+    rng = np.random.default_rng(args.seed)
+    timings = {"pairwise_per_door": [], "networkx_multisource": [], "overlay_tree": [], "csr": []}
+    checks = {"networkx_multisource": {}, "overlay_tree": {}, "pairwise": {}}
+
+    for _ in range(args.repeat):
+        overlay, exits, doors = make_request(rng, args)
+
+        results = {}
+        for name, fn, door_set in (
+            ("networkx_multisource", networkx_tree, doors),
+            ("overlay_tree", overlay_tree, doors),
+            ("csr", csr_tree, doors),
+            ("pairwise", pairwise, doors[:args.pairwise_doors]),
+        ):
+            t0 = time.perf_counter()
+            results[name] = fn(overlay, exits, door_set)
+            elapsed = time.perf_counter() - t0
+            if name == "pairwise":
+                timings["pairwise_per_door"].append(elapsed / max(1, len(door_set)))
+            else:
+                timings[name].append(elapsed)
+
+        csr = results["csr"]
+        for name in checks:
+            counts = compare(overlay, results[name], csr)
+            for key, value in counts.items():
+                checks[name][key] = checks[name].get(key, 0) + value
+
+    stats = {name: summarize(samples) for name, samples in timings.items()}
+    pairwise_request = stats["pairwise_per_door"]["mean_ms"] * args.doors
+    report = {
+        "nodes": server.SNAPSHOT.node_count,
+        "edges": server.SNAPSHOT.edge_count,
+        "exits": args.exits,
+        "doors": args.doors,
+        "fires": args.fires,
+        "repeat": args.repeat,
+        "timings": stats,
+        "pairwise_estimated_request_ms": round(pairwise_request, 1),
+        "speedup_vs_networkx_multisource": round(stats["networkx_multisource"]["mean_ms"] / stats["csr"]["mean_ms"], 2),
+        "speedup_vs_pairwise": round(pairwise_request / stats["csr"]["mean_ms"], 1),
+        "csr_vs": checks
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    print(text)
+    if any(c.get("different") for c in checks.values()):
+        sys.exit(1)
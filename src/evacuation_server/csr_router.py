@@ -0,0 +1,90 @@
+"""
+Array-backed router over the graph snapshot. Incoming edges are stored in
+CSR form (offsets per head node, tail node, edge id, length, capacity) so a
+request computes every edge cost in one vectorized pass from the overlay,
+and the reverse multi-source Dijkstra runs over plain arrays instead of
+calling a Python weight function through networkx for every relaxation.
+Gives the same exit tree as RouteOverlay.exit_tree.
+"""
+import heapq
+
+import numpy as np
+
+from route_overlay import BLOCKED_PENALTY, CONGESTION_WEIGHT
+
+NO_EXIT = -1        # next_hop of a node that cannot reach any exit
+AT_EXIT = -2        # next_hop of an exit node
+
+
+class CsrRouter:
+
+    def __init__(self, snapshot):
+        self.node_ids = snapshot.node_ids
+        self.index = {n: i for i, n in enumerate(snapshot.node_ids.tolist())}
+
+        # Incoming edges grouped by head node
+        order = np.argsort(snapshot.edge_v, kind="stable")
+        counts = np.bincount(snapshot.edge_v, minlength=snapshot.node_count)
+        self.offsets = np.zeros(snapshot.node_count + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.offsets[1:])
+        self.tails = snapshot.edge_u[order].astype(np.int64)
+        self.eids = order.astype(np.int64)
+        self.length = np.asarray(snapshot.edge_length)[order]
+        self.capacity = np.asarray(snapshot.edge_capacity)[order]
+
+        # The search loop indexes lists, much cheaper than NumPy scalars
+        self._offsets = self.offsets.tolist()
+        self._tails = self.tails.tolist()
+
+    def costs(self, overlay):
+        """Cost of every edge in CSR order, inf where blocked, in one pass."""
+        risk = overlay.risk[self.eids]
+        load = overlay.load[self.eids]
+        cost = self.length * (1.0 + CONGESTION_WEIGHT * (load / self.capacity)) + risk
+        cost[risk >= BLOCKED_PENALTY] = np.inf
+        return cost
+
+    def exit_tree(self, overlay, exits):
+        """
+        Reverse Dijkstra from all exit node ids at once. Returns next_hop,
+        a list with the next node index towards the cheapest exit per node
+        (AT_EXIT for exits, NO_EXIT when none is reachable).
+        """
+        cost = self.costs(overlay).tolist()
+        offsets, tails = self._offsets, self._tails
+        n = len(offsets) - 1
+        inf = float("inf")
+        dist = [inf] * n
+        next_hop = [NO_EXIT] * n
+        done = [False] * n
+
+        heap = []
+        for node in exits:
+            i = self.index[node]
+            dist[i] = 0.0
+            next_hop[i] = AT_EXIT
+            heap.append((0.0, i))
+        heapq.heapify(heap)
+
+        while heap:
+            d, v = heapq.heappop(heap)
+            if done[v]: continue
+            done[v] = True
+            for k in range(offsets[v], offsets[v + 1]):
+                u = tails[k]
+                if done[u]: continue
+                nd = d + cost[k]         # blocked edges are inf and never win
+                if nd < dist[u]:
+                    dist[u] = nd
+                    next_hop[u] = v
+                    heapq.heappush(heap, (nd, u))
+        return next_hop
+
+    def exit_path(self, next_hop, start):
+        """Door node id -> [node id, ..., exit node id], None when no exit is reachable."""
+        i = self.index.get(start)
+        if i is None or next_hop[i] == NO_EXIT: return None
+        path = [i]
+        while next_hop[path[-1]] != AT_EXIT:
+            path.append(next_hop[path[-1]])
+        return self.node_ids[path].tolist()
@@ -1,16 +1,26 @@
 from flask import Flask, request, jsonify
-import networkx as nx
-import osmnx as ox
+import numpy as np
+import os
 import sys
 import traceback
 import math
 import requests  # To talk to FIWARE
-from shapely.geometry import Point
+from pyproj import Transformer
+from graph_snapshot import load_snapshot
+from spatial_index import EdgeIndex, NodeIndex
+from route_overlay import BLOCKED_PENALTY, RouteOverlay, exit_path
+from csr_router import CsrRouter
 
 app = Flask(__name__)
 MAP_FILE = "map.osm"
-RAW_G = None        
-G = None            
+SNAPSHOT_FILE = os.getenv("GRAPH_SNAPSHOT", "map.graph")   # built by graph_snapshot.py
+SNAPSHOT = None     # memory-mapped node/edge arrays, shared by every worker
+G = None            # shared base graph, never modified by requests
+TO_PROJECTED = None
+NODE_INDEX = None   # KD-tree over node coordinates + memoized door/exit snaps
+EDGE_INDEX = None   # STRtree over edge segments + memoized radar snaps
+ROUTING_ENGINE = os.getenv("ROUTING_ENGINE", "csr")   # "csr" (arrays) or "networkx"
+CSR_ROUTER = None
 
 # --- CONFIGURATION ---
 DEADLY_RADIUS = 40.0   
@@ -20,15 +30,13 @@ FIWARE_SERVICE_PATH = "/2025_team2"
 
 print("[Engine] Loading Map...")
 try:
-    RAW_G = ox.graph_from_xml(MAP_FILE, simplify=False)
-    G_proj = ox.project_graph(RAW_G)
-    G = nx.DiGraph(G_proj)
-    for u, v, data in G.edges(data=True):
-        data.setdefault('length', 10.0)
-        data.setdefault('risk_penalty', 0.0)
-        data.setdefault('capacity', 100.0)
-        data.setdefault('virtual_load', 0.0)
-    print("[Engine] Map Ready.")
+    SNAPSHOT = load_snapshot(MAP_FILE, SNAPSHOT_FILE)
+    G = SNAPSHOT.to_networkx()
+    TO_PROJECTED = Transformer.from_crs("EPSG:4326", SNAPSHOT.crs, always_xy=True)
+    NODE_INDEX = NodeIndex(SNAPSHOT, TO_PROJECTED)
+    EDGE_INDEX = EdgeIndex(SNAPSHOT, TO_PROJECTED)
+    if ROUTING_ENGINE == "csr": CSR_ROUTER = CsrRouter(SNAPSHOT)
+    print(f"[Engine] Map Ready ({SNAPSHOT.node_count} nodes, {SNAPSHOT.edge_count} edges, {ROUTING_ENGINE} router).")
 except Exception as e:
     print(f"Error loading map: {e}")
     sys.exit(1)
@@ -110,135 +118,121 @@ def fetch_context_from_fiware():
         return [], [], []
 
 def get_nearest_node(lat, lng):
-    return ox.distance.nearest_nodes(RAW_G, X=lng, Y=lat)
-
-def _edge_cost(u, v, d):
-    length = d.get('length', 10.0)
-    risk = d.get('risk_penalty', 0.0)
-    if risk >= 1e9: return float('inf')
-    capacity = float(d.get('capacity', 100.0))
-    load = d.get('virtual_load', 0.0)
-    
-    congestion_factor = 1.0 + (2.0 * (load / capacity)) 
-    
-    return (length * congestion_factor) + risk
-
-def get_distance_point_to_segment(px, py, x1, y1, x2, y2):
-    dx = x2 - x1
-    dy = y2 - y1
-    if dx == 0 and dy == 0: return math.hypot(px - x1, py - y1)
-    t = ((px - x1) * dx + (py - y1) * dy) / (dx*dx + dy*dy)
-    t = max(0, min(1, t))
-    nearest_x = x1 + t * dx
-    nearest_y = y1 + t * dy
-    return math.hypot(px - nearest_x, py - nearest_y)
-
-def apply_fire_risk_projected(graph, fire_lat, fire_lng):
-    fire_point = Point(fire_lng, fire_lat)
-    fire_point_proj, _ = ox.projection.project_geometry(fire_point, crs=RAW_G.graph['crs'], to_crs=graph.graph['crs'])
-    fx, fy = fire_point_proj.x, fire_point_proj.y
-    for u, v, data in graph.edges(data=True):
-        u_data, v_data = graph.nodes[u], graph.nodes[v]
-        dist = get_distance_point_to_segment(fx, fy, u_data['x'], u_data['y'], v_data['x'], v_data['y'])
-        if dist <= DEADLY_RADIUS: data['risk_penalty'] = 1e9
-        elif dist <= CAUTION_RADIUS: 
-            factor = (CAUTION_RADIUS - dist) / (CAUTION_RADIUS - DEADLY_RADIUS)
-            data['risk_penalty'] += 5000.0 * (factor ** 2)
-
-def apply_realtime_congestion(graph, congestion_points):
+    return NODE_INDEX.snap([(lat, lng)])[0]
+
+def snap_points(points):
+    # [{'lat', 'lng'}] -> [node id or None], one batched KD-tree query for everything not memoized yet
+    valid = []
+    for i, p in enumerate(points):
+        try:
+            if math.isfinite(float(p['lat'])) and math.isfinite(float(p['lng'])): valid.append(i)
+        except (KeyError, TypeError, ValueError): continue
+    nodes = [None] * len(points)
+    for i, n in zip(valid, NODE_INDEX.snap([(points[i]['lat'], points[i]['lng']) for i in valid])):
+        nodes[i] = n
+    return nodes
+
+def fire_risk_penalties(fires):
+    """
+    [(lat, lng)] fires -> (edge indices, penalties), only for the edges within
+    CAUTION_RADIUS of at least one fire. Penalties of several fires add up;
+    inside DEADLY_RADIUS of any fire the edge is blocked.
+    """
+    if not fires: return np.empty(0, dtype=np.int64), np.empty(0)
+    lats, lngs = zip(*fires)
+    _, edges, dist = EDGE_INDEX.within(lats, lngs, CAUTION_RADIUS)
+
+    factor = (CAUTION_RADIUS - dist) / (CAUTION_RADIUS - DEADLY_RADIUS)
+    penalty = np.where(dist <= DEADLY_RADIUS, BLOCKED_PENALTY, 5000.0 * (factor ** 2))
+
+    affected, slot = np.unique(edges, return_inverse=True)
+    total = np.zeros(len(affected))
+    np.add.at(total, slot, penalty)
+    return affected, np.minimum(total, BLOCKED_PENALTY)
+
+def apply_fire_risk_projected(overlay, fires):
+    edges, penalties = fire_risk_penalties(fires)
+    overlay.set_risk(edges, penalties)
+
+def apply_realtime_congestion(overlay, congestion_points):
 
     if not congestion_points: return
 
+    points = []
     for p in congestion_points:
-        try:
-            # Project Point to Graph CRS
-            point_geom = Point(p['lng'], p['lat'])
-            point_proj, _ = ox.projection.project_geometry(point_geom, crs=RAW_G.graph['crs'], to_crs=graph.graph['crs'])
-            
-            # Find Nearest Edge (u, v)
-            u, v, key = ox.distance.nearest_edges(ox.project_graph(RAW_G), point_proj.x, point_proj.y)
-            
-            # Update the graph
-            if graph.has_edge(u, v):
-                # Add the flow count to the edge's load
-                graph[u][v]['virtual_load'] += p['flow']
-                
-        except Exception as e:
-            pass
+        try: points.append((float(p['lat']), float(p['lng']), float(p['flow'])))
+        except (KeyError, TypeError, ValueError): continue
+    if not points: return
+
+    # All radar points snapped to their nearest edge in one query
+    edges = EDGE_INDEX.snap([(lat, lng) for lat, lng, _ in points])
+    # Add the flow count to the edge's load
+    overlay.add_load(edges, [flow for _, _, flow in points])
+
+def exit_routes(overlay, exits):
+    # Cheapest exit for every node in one search -> door node -> path lookup
+    if CSR_ROUTER is not None:
+        next_hop = CSR_ROUTER.exit_tree(overlay, exits)
+        return lambda door: CSR_ROUTER.exit_path(next_hop, door)
+    next_hop = overlay.exit_tree(G, exits)
+    return lambda door: exit_path(next_hop, door)
 
 @app.route('/calculate-global-evacuation', methods=['POST'])
 def calculate_global_evacuation():
     try:
         data = request.json
-        fire_loc = data.get('fire_location')
+        # One fire_location, or several simultaneous ones in fire_locations
+        fire_locs = data.get('fire_locations') or ([data['fire_location']] if data.get('fire_location') else [])
 
-        if not fire_loc: return jsonify({"error": "Missing fire_location"}), 400
+        if not fire_locs: return jsonify({"error": "Missing fire_location"}), 400
+        try:
+            fires = [(float(f['lat']), float(f['lng'])) for f in fire_locs]
+        except (KeyError, TypeError, ValueError):
+            return jsonify({"error": "Invalid fire_location"}), 400
 
         buildings, safe_zones, congestion_points = fetch_context_from_fiware()
         
         if not buildings or not safe_zones:
             return jsonify({"error": "No Buildings/Exits found in FIWARE"}), 400
 
-        temp_G = G.copy()
-        apply_fire_risk_projected(temp_G, fire_loc['lat'], fire_loc['lng'])
+        # Request state goes into overlay arrays, G itself stays shared
+        overlay = RouteOverlay(SNAPSHOT)
+        apply_fire_risk_projected(overlay, fires)
 
         # 3. Apply Radar Congestion (NEW)
-        apply_realtime_congestion(temp_G, congestion_points)
+        apply_realtime_congestion(overlay, congestion_points)
         
-        valid_targets = []
-        fire_point = Point(fire_loc['lng'], fire_loc['lat'])
-        fire_proj, _ = ox.projection.project_geometry(fire_point, crs=RAW_G.graph['crs'], to_crs=G.graph['crs'])
-        fx, fy = fire_proj.x, fire_proj.y
-
-        for sz in safe_zones:
-            try:
-                tn = get_nearest_node(sz['lat'], sz['lng'])
-                if tn in temp_G: valid_targets.append(tn)
-            except: continue
+        # Every exit and door snapped in one batched lookup
+        door_lists = [b.get('doors', []) for b in buildings]
+        snapped = snap_points(safe_zones + [door for doors in door_lists for door in doors])
+        door_nodes = iter(snapped[len(safe_zones):])
+        valid_targets = [tn for tn in snapped[:len(safe_zones)] if tn is not None and tn in G]
 
         if not valid_targets: return jsonify({"status": "error", "message": "ALL EXITS BLOCKED"}), 400
 
         results = {}
+        route = None
 
-        for b in buildings:
-            doors = b.get('doors', [])
+        for b, doors in zip(buildings, door_lists):
             people = b.get('people', 50)
             paths = []
             for door in doors:
+                start_node = next(door_nodes)
                 try:
-                    start_node = get_nearest_node(door['lat'], door['lng'])
-                    if start_node not in temp_G: continue
-                    
-                    best_path, best_cost = None, float('inf')
-                    for target in valid_targets:
-                        try:
-                            path = nx.shortest_path(temp_G, start_node, target, weight=_edge_cost)
-                            valid_path = True
-                            cost = 0
-                            for i in range(len(path)-1):
-                                u, v = path[i], path[i+1]
-                                ec = _edge_cost(u, v, temp_G[u][v])
-                                if ec >= 1e9: 
-                                    valid_path = False
-                                    break
-                                cost += ec
-                            
-                            if valid_path and cost < best_cost:
-                                best_cost = cost
-                                best_path = path
-                        except: continue
+                    # Cheapest exit for every node in one search, redone after every
+                    # assigned door so its evacuees steer the next door elsewhere
+                    if route is None: route = exit_routes(overlay, valid_targets)
+                    best_path = route(start_node)
                     
                     if best_path:
                         coords = []
                         for n in best_path:
-                            nd = RAW_G.nodes[n]
-                            coords.append({"lat": nd['y'], "lng": nd['x']})
+                            nd = G.nodes[n]
+                            coords.append({"lat": nd['lat'], "lng": nd['lon']})
                         paths.append(coords)
                         
-                        for i in range(len(best_path)-1):
-                            u, v = best_path[i], best_path[i+1]
-                            if temp_G.has_edge(u, v):
-                                temp_G[u][v]['virtual_load'] += people
+                        overlay.add_load(overlay.path_edges(G, best_path), people)
+                        route = None
                 except: continue
             results[b['id']] = paths
         # print (results)
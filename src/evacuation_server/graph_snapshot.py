@@ -0,0 +1,173 @@
+"""
+Precomputed evacuation graph: map.osm parsed, projected and flattened into
+one binary file of aligned arrays (node ids / coordinates, edge endpoints /
+length / capacity) plus the CRS and the SHA-256 of the OSM file it came from.
+The server memory-maps it, so startup skips XML parsing and projection and
+every worker shares the same pages. Rebuilt when the OSM file changes.
+Usage: python graph_snapshot.py [map.osm] [map.graph]
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+
+import numpy as np
+
+MAGIC = b"EVGSNAP1"
+ALIGN = 64
+DEFAULT_LENGTH = 10.0
+DEFAULT_CAPACITY = 100.0
+
+
+def osm_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+class GraphSnapshot:
+    """
+    Read-only arrays of the projected graph. Nodes are indexed 0..N-1 in
+    node_ids order; edges 0..E-1 point into them through edge_u / edge_v.
+    """
+
+    def __init__(self, arrays, meta):
+        self.meta = meta
+        self.crs = meta["crs"]
+        self.osm_sha256 = meta["osm_sha256"]
+        self.node_ids = arrays["node_ids"]
+        self.node_x = arrays["node_x"]          # projected metres
+        self.node_y = arrays["node_y"]
+        self.node_lon = arrays["node_lon"]      # WGS84, for the coordinates sent back to clients
+        self.node_lat = arrays["node_lat"]
+        self.edge_u = arrays["edge_u"]
+        self.edge_v = arrays["edge_v"]
+        self.edge_length = arrays["edge_length"]
+        self.edge_capacity = arrays["edge_capacity"]
+
+    @property
+    def node_count(self):
+        return len(self.node_ids)
+
+    @property
+    def edge_count(self):
+        return len(self.edge_u)
+
+    def to_networkx(self):
+        """DiGraph with the attributes the router expects (x, y, lon, lat / eid, length, capacity)."""
+        import networkx as nx
+        G = nx.DiGraph(crs=self.crs)
+        ids = self.node_ids.tolist()
+        G.add_nodes_from(
+            (n, {"x": x, "y": y, "lon": lon, "lat": lat})
+            for n, x, y, lon, lat in zip(ids, self.node_x.tolist(), self.node_y.tolist(), self.node_lon.tolist(), self.node_lat.tolist())
+        )
+        # eid indexes the edge arrays, per-request state is kept in arrays outside the graph
+        G.add_edges_from(
+            (ids[u], ids[v], {"eid": e, "length": length, "capacity": capacity})
+            for e, (u, v, length, capacity) in enumerate(zip(self.edge_u.tolist(), self.edge_v.tolist(), self.edge_length.tolist(), self.edge_capacity.tolist()))
+        )
+        return G
+
+
+def build_arrays(osm_path):
+    """Parses and projects the OSM file the way the server always has (simplify=False, DiGraph)."""
+    import networkx as nx
+    import osmnx as ox
+
+    raw = ox.graph_from_xml(osm_path, simplify=False)
+    projected = nx.DiGraph(ox.project_graph(raw))
+
+    node_ids = np.fromiter(projected.nodes, dtype=np.int64, count=projected.number_of_nodes())
+    index = {n: i for i, n in enumerate(node_ids.tolist())}
+    nodes = projected.nodes
+    arrays = {
+        "node_ids": node_ids,
+        "node_x": np.array([nodes[n]["x"] for n in node_ids.tolist()], dtype=np.float64),
+        "node_y": np.array([nodes[n]["y"] for n in node_ids.tolist()], dtype=np.float64),
+        "node_lon": np.array([raw.nodes[n]["x"] for n in node_ids.tolist()], dtype=np.float64),
+        "node_lat": np.array([raw.nodes[n]["y"] for n in node_ids.tolist()], dtype=np.float64),
+    }
+
+    edges = list(projected.edges(data=True))
+    arrays["edge_u"] = np.array([index[u] for u, _, _ in edges], dtype=np.int32)
+    arrays["edge_v"] = np.array([index[v] for _, v, _ in edges], dtype=np.int32)
+    arrays["edge_length"] = np.array([d.get("length", DEFAULT_LENGTH) for _, _, d in edges], dtype=np.float64)
+    arrays["edge_capacity"] = np.array([float(d.get("capacity", DEFAULT_CAPACITY)) for _, _, d in edges], dtype=np.float64)
+    return arrays, str(projected.graph["crs"])
+
+
+def write_snapshot(path, arrays, meta):
+    layout, offset = {}, 0
+    for name, arr in arrays.items():
+        layout[name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": offset}
+        offset = _align(offset + arr.nbytes)
+    header = json.dumps({**meta, "arrays": layout}).encode()
+    data_start = _align(len(MAGIC) + 8 + len(header))
+
+    # Written next to the target and renamed, so a worker never maps a half-written file
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(header).to_bytes(8, "little"))
+        f.write(header)
+        for name, arr in arrays.items():
+            f.seek(data_start + layout[name]["offset"])
+            f.write(np.ascontiguousarray(arr).tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp, path)
+
+
+def read_snapshot(path):
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not an evacuation graph snapshot")
+        header_len = int.from_bytes(f.read(8), "little")
+        meta = json.loads(f.read(header_len))
+    data_start = _align(len(MAGIC) + 8 + header_len)
+
+    arrays = {}
+    for name, spec in meta.pop("arrays").items():
+        shape = tuple(spec["shape"])
+        if not np.prod(shape):
+            arrays[name] = np.zeros(shape, dtype=spec["dtype"])
+            continue
+        arrays[name] = np.memmap(path, dtype=spec["dtype"], mode="r", offset=data_start + spec["offset"], shape=shape)
+    return GraphSnapshot(arrays, meta)
+
+
+def build_snapshot(osm_path, snapshot_path, digest=None):
+    started = time.perf_counter()
+    arrays, crs = build_arrays(osm_path)
+    meta = {"crs": crs, "osm_sha256": digest or osm_hash(osm_path), "source": os.path.basename(osm_path)}
+    write_snapshot(snapshot_path, arrays, meta)
+    print(f"[Snapshot] {len(arrays['node_ids'])} nodes, {len(arrays['edge_u'])} edges -> {snapshot_path} ({time.perf_counter() - started:.1f}s)")
+
+
+def load_snapshot(osm_path, snapshot_path):
+    """Maps the snapshot, rebuilding it first when it is missing, unreadable or from another OSM file."""
+    digest = osm_hash(osm_path)
+    try:
+        snapshot = read_snapshot(snapshot_path)
+        if snapshot.osm_sha256 == digest:
+            return snapshot
+        print(f"[Snapshot] {osm_path} changed, rebuilding {snapshot_path}")
+    except FileNotFoundError:
+        print(f"[Snapshot] {snapshot_path} missing, building it from {osm_path}")
+    except (ValueError, KeyError) as e:
+        print(f"[Snapshot] {snapshot_path} unreadable ({e}), rebuilding")
+    build_snapshot(osm_path, snapshot_path, digest)
+    return read_snapshot(snapshot_path)
+
+
+if __name__ == "__main__":
+    osm_path = sys.argv[1] if len(sys.argv) > 1 else "map.osm"
+    snapshot_path = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(osm_path)[0] + ".graph"
+    build_snapshot(osm_path, snapshot_path)
@@ -0,0 +1,77 @@
+"""
+Per-request edge state on top of the shared base graph. The base graph and
+the snapshot arrays are never modified; fire risk, radar congestion and the
+load of already assigned evacuees live in arrays indexed by edge id, so a
+request only writes the edges it affects instead of copying the whole graph.
+"""
+import heapq
+
+import numpy as np
+
+BLOCKED_PENALTY = 1e9       # risk at or above this closes the edge
+CONGESTION_WEIGHT = 2.0     # cost multiplier per unit of load / capacity
+
+
+class RouteOverlay:
+
+    def __init__(self, snapshot):
+        self.length = snapshot.edge_length
+        self.capacity = snapshot.edge_capacity
+        # calloc-backed, pages are only touched for the edges that get written
+        self.risk = np.zeros(snapshot.edge_count)
+        self.load = np.zeros(snapshot.edge_count)
+
+    def set_risk(self, edges, penalties):
+        self.risk[edges] = penalties
+
+    def add_load(self, edges, amounts):
+        # np.add.at so an edge listed twice gets both amounts
+        np.add.at(self.load, np.asarray(edges, dtype=np.intp), amounts)
+
+    def cost(self, e):
+        risk = self.risk[e]
+        if risk >= BLOCKED_PENALTY: return float('inf')
+        congestion_factor = 1.0 + CONGESTION_WEIGHT * (self.load[e] / self.capacity[e])
+        return float(self.length[e] * congestion_factor + risk)
+
+    def weight(self, u, v, d):
+        """networkx weight function over the base graph's 'eid' edge attribute."""
+        return self.cost(d['eid'])
+
+    def path_edges(self, graph, path):
+        return [graph[u][v]['eid'] for u, v in zip(path, path[1:])]
+
+    def exit_tree(self, graph, exits):
+        """
+        One reverse Dijkstra from all exits at once (walking incoming edges),
+        blocked edges skipped. Returns {node: next node towards its cheapest
+        exit} for every node that can reach one; exits map to None.
+        """
+        dist = {n: 0.0 for n in exits}
+        next_hop = {n: None for n in exits}
+        heap = [(0.0, n) for n in dist]
+        heapq.heapify(heap)
+        done = set()
+        while heap:
+            d, v = heapq.heappop(heap)
+            if v in done: continue
+            done.add(v)
+            for u, data in graph.pred[v].items():
+                if u in done: continue
+                cost = self.cost(data['eid'])
+                if cost == float('inf'): continue      # blocked by fire
+                nd = d + cost
+                if nd < dist.get(u, float('inf')):
+                    dist[u] = nd
+                    next_hop[u] = v
+                    heapq.heappush(heap, (nd, u))
+        return next_hop
+
+
+def exit_path(next_hop, start):
+    """Door node -> [node, ..., exit] by following the exit tree, None when no exit is reachable."""
+    if start not in next_hop: return None
+    path = [start]
+    while next_hop[path[-1]] is not None:
+        path.append(next_hop[path[-1]])
+    return path
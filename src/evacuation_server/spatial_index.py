@@ -0,0 +1,101 @@
+"""
+Spatial lookups over the graph snapshot, built once at startup.
+Queries take WGS84 points in batches and project them in one pyproj call.
+"""
+import numpy as np
+import shapely
+from scipy.spatial import cKDTree
+
+
+def segment_distances(px, py, x1, y1, x2, y2):
+    """Point-to-segment distance, element-wise over equally shaped arrays."""
+    dx, dy = x2 - x1, y2 - y1
+    length_sq = dx * dx + dy * dy
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.where(length_sq > 0, ((px - x1) * dx + (py - y1) * dy) / length_sq, 0.0)
+    t = np.clip(t, 0.0, 1.0)
+    return np.hypot(px - (x1 + t * dx), py - (y1 + t * dy))
+
+
+def snap_key(lat, lng):
+    # ~1 cm, so the same door/exit read from FIWARE twice hits the memo
+    return (round(float(lat), 7), round(float(lng), 7))
+
+
+class NodeIndex:
+    """
+    KD-tree over projected node coordinates. snap() memoizes results per
+    point, since building doors and safe zones do not move.
+    """
+
+    def __init__(self, snapshot, to_projected):
+        self.snapshot = snapshot
+        self.to_projected = to_projected
+        self.tree = cKDTree(np.column_stack([snapshot.node_x, snapshot.node_y]))
+        self.memo = {}           # snap_key -> node id
+
+    def nearest(self, lats, lngs):
+        """Node id nearest to each (lat, lng), as an int64 array."""
+        xs, ys = self.to_projected.transform(np.asarray(lngs, dtype=np.float64), np.asarray(lats, dtype=np.float64))
+        _, idx = self.tree.query(np.column_stack([np.atleast_1d(xs), np.atleast_1d(ys)]))
+        return self.snapshot.node_ids[idx]
+
+    def snap(self, points):
+        """[(lat, lng)] -> [node id]; only points not seen before are queried, all in one call."""
+        keys = [snap_key(lat, lng) for lat, lng in points]
+        missing = list({k for k in keys if k not in self.memo})
+        if missing:
+            ids = self.nearest([k[0] for k in missing], [k[1] for k in missing])
+            self.memo.update(zip(missing, ids.tolist()))
+        return [self.memo[k] for k in keys]
+
+
+class EdgeIndex:
+    """
+    STRtree over the projected edge segments (simplify=False, so every edge
+    is one straight segment). snap() memoizes results per point, since the
+    radar positions are fixed.
+    """
+
+    def __init__(self, snapshot, to_projected):
+        self.snapshot = snapshot
+        self.to_projected = to_projected
+        u, v = snapshot.edge_u, snapshot.edge_v
+        # Endpoint coordinates per edge, for vectorized distances
+        self.x1, self.y1 = snapshot.node_x[u], snapshot.node_y[u]
+        self.x2, self.y2 = snapshot.node_x[v], snapshot.node_y[v]
+        ends = np.stack([
+            np.column_stack([self.x1, self.y1]),
+            np.column_stack([self.x2, self.y2])
+        ], axis=1)
+        self.tree = shapely.STRtree(shapely.linestrings(ends))
+        self.memo = {}           # snap_key -> edge index
+
+    def nearest(self, lats, lngs):
+        """Index of the edge nearest to each (lat, lng), as an int array."""
+        xs, ys = self.to_projected.transform(np.asarray(lngs, dtype=np.float64), np.asarray(lats, dtype=np.float64))
+        points = shapely.points(np.atleast_1d(xs), np.atleast_1d(ys))
+        hits = self.tree.query_nearest(points, all_matches=False)
+        edges = np.empty(len(points), dtype=np.int64)
+        edges[hits[0]] = hits[1]
+        return edges
+
+    def within(self, lats, lngs, radius):
+        """
+        Every (point, edge) pair closer than radius metres, as three arrays:
+        point index, edge index, distance. The tree narrows the candidates,
+        the distances are then computed in one pass.
+        """
+        xs, ys = self.to_projected.transform(np.asarray(lngs, dtype=np.float64), np.asarray(lats, dtype=np.float64))
+        xs, ys = np.atleast_1d(xs), np.atleast_1d(ys)
+        p, e = self.tree.query(shapely.points(xs, ys), predicate="dwithin", distance=radius)
+        return p, e, segment_distances(xs[p], ys[p], self.x1[e], self.y1[e], self.x2[e], self.y2[e])
+
+    def snap(self, points):
+        """[(lat, lng)] -> [edge index]; only points not seen before are queried, all in one call."""
+        keys = [snap_key(lat, lng) for lat, lng in points]
+        missing = list({k for k in keys if k not in self.memo})
+        if missing:
+            edges = self.nearest([k[0] for k in missing], [k[1] for k in missing])
+            self.memo.update(zip(missing, edges.tolist()))
+        return [self.memo[k] for k in keys]
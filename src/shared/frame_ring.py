@@ -0,0 +1,195 @@
+"""
+Shared-memory ring of raw BGR frames from camerascreenshot (writer) to
+ai_pipeline (reader) when both run on the same host. Replaces the
+JPEG -> base64 -> JSON -> base64 -> imdecode round trip of the HTTP path.
+Both containers need the same /dev/shm (e.g. `ipc: host` in compose).
+
+Single source for src/camerascreenshot and src/ai_pipeline: their Docker
+builds copy it in from src/shared (docker build --build-context shared=../shared .),
+local runs find it through the sys.path entry in each service's main module.
+
+Layout: RING_HEADER, then `slots` slots of [SLOT_HEADER | pixels], 64-byte aligned.
+Each slot is a seqlock: its seq is odd while the writer fills it and even once
+the frame is complete. The reader copies the pixels out and re-checks seq, so
+it never hands out a half-written frame or one the writer reuses later.
+"""
+import math
+import time
+import struct
+from multiprocessing import shared_memory, resource_tracker
+
+MAGIC = 0x474E5246           # "FRNG"
+VERSION = 1
+ALIGN = 64
+
+# magic, version, slots, reserved, slot_bytes, frames written, writer heartbeat (unix time)
+RING_HEADER = struct.Struct("<IIIIQQd")
+# seq, timestamp, camera id, height, width, channels, lon, lat, rotationAngle, calibrationConstant (NaN = unknown)
+SLOT_HEADER = struct.Struct("<Qd128sIII4xdddd")
+SEQ = struct.Struct("<Q")
+WRITTEN_OFFSET = 24          # frames written + heartbeat inside RING_HEADER
+WRITTEN = struct.Struct("<Qd")
+
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+PIXELS_OFFSET = _align(SLOT_HEADER.size)
+
+
+def _slot_stride(slot_bytes):
+    return PIXELS_OFFSET + _align(slot_bytes)
+
+
+def _slot_offset(slot, slot_bytes):
+    return _align(RING_HEADER.size) + slot * _slot_stride(slot_bytes)
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class FrameRingWriter:
+    def __init__(self, name, slots, slot_bytes):
+        self.name = name
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        size = _slot_offset(slots, slot_bytes)
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Left over from a previous run, its layout may differ
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        self.buf = self.shm.buf
+        self.cursor = 0
+        self.seqs = [0] * slots
+        self.written = 0
+        RING_HEADER.pack_into(self.buf, 0, MAGIC, VERSION, slots, 0, slot_bytes, 0, time.time())
+
+    def write(self, camera_id, pixels, height, width, channels=3, location=None, rotation=None, calibration=None):
+        """
+        pixels: height*width*channels bytes (BGR, row-major).
+        location: (lon, lat) or None. Overwrites the oldest slot.
+        """
+        if len(pixels) > self.slot_bytes:
+            raise ValueError(f"{width}x{height} frame does not fit a {self.slot_bytes} byte slot")
+        encoded_id = camera_id.encode()
+        if len(encoded_id) > 128:
+            raise ValueError(f"camera id longer than 128 bytes: {camera_id}")
+
+        slot = self.cursor
+        self.cursor = (self.cursor + 1) % self.slots
+        offset = _slot_offset(slot, self.slot_bytes)
+        lon, lat = location if location else (math.nan, math.nan)
+
+        seq = self.seqs[slot] + 1    # odd: readers skip this slot until the frame is complete
+        SLOT_HEADER.pack_into(
+            self.buf, offset, seq, time.time(), encoded_id, height, width, channels,
+            _number(lon), _number(lat), _number(rotation), _number(calibration)
+        )
+        start = offset + PIXELS_OFFSET
+        self.buf[start:start + len(pixels)] = pixels
+        SEQ.pack_into(self.buf, offset, seq + 1)
+        self.seqs[slot] = seq + 1
+
+        self.written += 1
+        WRITTEN.pack_into(self.buf, WRITTEN_OFFSET, self.written, time.time())
+
+    def heartbeat(self):
+        # Lets readers tell a quiet writer (all cameras failing) from a dead one
+        WRITTEN.pack_into(self.buf, WRITTEN_OFFSET, self.written, time.time())
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        self.shm.unlink()
+
+
+class FrameRingReader:
+    """
+    Maps the ring read-only in spirit. Frames come out as private copies (one
+    memcpy each): the writer's round robin rewrites a slot after `slots` newer
+    frames, and a view could change under a frame still queued for the engine.
+    """
+
+    def __init__(self, name, accept=None):
+        self.shm = shared_memory.SharedMemory(name=name)   # FileNotFoundError when the writer is not up
+        try:
+            # Python < 3.13 tracks attached segments too and would unlink the writer's ring on exit
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+        except Exception:
+            pass
+
+        magic, version, slots, _, slot_bytes, _, _ = RING_HEADER.unpack_from(self.shm.buf, 0)
+        if magic != MAGIC or version != VERSION:
+            self.shm.close()
+            raise ValueError(f"{name} is not a version {VERSION} frame ring")
+        self.name = name
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.accept = accept
+        self.seen = [0] * slots      # last seq delivered per slot
+
+    def heartbeat_age(self):
+        _, heartbeat = WRITTEN.unpack_from(self.shm.buf, WRITTEN_OFFSET)
+        return time.time() - heartbeat
+
+    def _meta(self, lon, lat, rotation, calibration):
+        meta = {"location": {}, "rotationAngle": {}, "calibrationConstant": {}}
+        if not (math.isnan(lon) or math.isnan(lat)):
+            meta["location"] = {"type": "geo:json", "value": {"type": "Point", "coordinates": [lon, lat]}}
+        if not math.isnan(rotation):
+            meta["rotationAngle"] = {"type": "Number", "value": rotation}
+        if not math.isnan(calibration):
+            meta["calibrationConstant"] = {"type": "Number", "value": calibration}
+        return meta
+
+    def next_batch(self, max_size, exclude=()):
+        """
+        Newest unread frame per camera, oldest first: [(frame, camera_id, camera_meta)].
+        Same contract as GrabberPool.next_batch; cameras in exclude stay unread.
+        """
+        import numpy as np
+
+        buf = self.shm.buf
+        latest = {}
+        for slot in range(self.slots):
+            offset = _slot_offset(slot, self.slot_bytes)
+            seq = SEQ.unpack_from(buf, offset)[0]
+            if seq & 1 or seq == self.seen[slot]: continue
+
+            _, ts, raw_id, h, w, c, lon, lat, rotation, calibration = SLOT_HEADER.unpack_from(buf, offset)
+            if SEQ.unpack_from(buf, offset)[0] != seq: continue    # rewritten while reading the header
+            camera_id = raw_id.rstrip(b"\0").decode()
+            if camera_id in exclude or (self.accept is not None and not self.accept(camera_id)): continue
+
+            previous = latest.get(camera_id)
+            if previous is not None:
+                if previous[1] >= ts:
+                    self.seen[slot] = seq    # superseded by a newer frame of the same camera
+                    continue
+                self.seen[previous[0]] = previous[2]
+            latest[camera_id] = (slot, ts, seq, (h, w, c), (lon, lat, rotation, calibration))
+
+        batch = []
+        for camera_id, (slot, ts, seq, shape, meta) in sorted(latest.items(), key=lambda kv: kv[1][1])[:max_size]:
+            offset = _slot_offset(slot, self.slot_bytes) + PIXELS_OFFSET
+            frame = np.ndarray(shape, dtype=np.uint8, buffer=buf, offset=offset).copy()
+            self.seen[slot] = seq
+            if SEQ.unpack_from(buf, _slot_offset(slot, self.slot_bytes))[0] != seq: continue    # rewritten while copying
+            batch.append((frame, camera_id, self._meta(*meta)))
+        return batch
+
+    def stop(self):
+        try:
+            self.shm.close()
+        except BufferError:
+            pass    # still referenced elsewhere, the mapping goes with the process
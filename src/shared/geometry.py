@@ -0,0 +1,146 @@
+"""
+Camera geometry shared by the AI pipeline and FireAdmin calibration:
+depth medians of image regions, calibration constant <-> distance, and
+projection of distances along the camera bearing to [lng, lat].
+Everything works on arrays, one call per frame instead of one per box.
+
+Single source for src/ai_pipeline and src/FireAdmin: their Docker builds
+copy it in from src/shared (--build-context shared=../shared), local runs
+find it through the sys.path entry in ai_pipeline.py / calibration.py.
+"""
+import cv2
+import numpy as np
+
+EARTH_RADIUS = 6378137.0     # metres (WGS84 equatorial)
+FOCAL_LENGTH_PX = 1200       # assumed focal length used by the calibration
+NEAR_DEPTH = 0.001           # depth medians below this give FAR_DISTANCE
+FAR_DISTANCE = 999.9
+MIN_CALIBRATION = 0.1        # smaller constants are treated as "not calibrated"
+
+
+# --- DEPTH ---
+
+def clip_box(box, shape, offset=(0, 0)):
+    """Frame box -> integer (x1, y1, x2, y2) inside an array of shape starting at offset."""
+    h, w = shape[:2]
+    x1, y1, x2, y2 = (int(v) for v in box)
+    x1, x2 = sorted((x1 - offset[0], x2 - offset[0]))
+    y1, y2 = sorted((y1 - offset[1], y2 - offset[1]))
+    return max(0, x1), max(0, y1), min(w, x2), min(h, y2)
+
+
+def box_medians(depth_map, boxes, offset=(0, 0)):
+    """Median depth inside each box (NaN when the box misses depth_map)."""
+    medians = np.full(len(boxes), np.nan, dtype=np.float64)
+    for i, box in enumerate(boxes):
+        x1, y1, x2, y2 = clip_box(box, depth_map.shape, offset)
+        if x2 > x1 and y2 > y1:
+            medians[i] = np.median(depth_map[y1:y2, x1:x2])
+    return medians
+
+
+def line_median(depth_map, p1, p2, thickness=2):
+    """Median depth along a drawn line (NaN when it misses depth_map)."""
+    mask = np.zeros(depth_map.shape[:2], dtype=np.uint8)
+    cv2.line(mask, tuple(map(int, p1)), tuple(map(int, p2)), 255, thickness)
+    values = depth_map[mask == 255]
+    return float(np.median(values)) if values.size else float("nan")
+
+
+# --- CALIBRATION ---
+
+def calibration_constant(real_height_m, pixel_height, depth_median, focal_px=FOCAL_LENGTH_PX):
+    """C such that distance = C / depth_median for an object of known height."""
+    return (real_height_m * focal_px / pixel_height) * depth_median
+
+
+def distances(medians, calibration, fallback):
+    """
+    Depth medians -> metres, rounded to cm. NaN medians give NaN, near-zero
+    medians FAR_DISTANCE, and an uncalibrated camera uses the fallback constant.
+    """
+    medians = np.asarray(medians, dtype=np.float64)
+    c = calibration if calibration >= MIN_CALIBRATION else fallback
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = np.round(c / medians, 2)
+    out[medians < NEAR_DEPTH] = FAR_DISTANCE
+    return out
+
+
+# --- PROJECTION ---
+
+def project(lng, lat, distance_m, bearing_deg):
+    """
+    Moves from (lng, lat) by distance_m along bearing_deg (0 = north, clockwise).
+    Scalars or arrays; returns [..., 2] as [lng, lat] (FIWARE order).
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    bearing = np.radians(bearing_deg)
+    distance_m = np.asarray(distance_m, dtype=np.float64)
+    d_lat = distance_m * np.cos(bearing) / EARTH_RADIUS
+    d_lng = distance_m * np.sin(bearing) / (EARTH_RADIUS * np.cos(np.radians(lat)))
+    return np.stack(np.broadcast_arrays(lng + np.degrees(d_lng), lat + np.degrees(d_lat)), axis=-1)
+
+
+class CameraPose:
+    __slots__ = ("lng", "lat", "bearing", "calibration")
+
+    def __init__(self, lng=None, lat=None, bearing=0.0, calibration=0.0):
+        self.lng = lng
+        self.lat = lat
+        self.bearing = bearing
+        self.calibration = calibration
+
+    @property
+    def located(self):
+        return self.lng is not None and self.lat is not None
+
+    def locate(self, dists):
+        """Distances -> [[lng, lat] or None]; None where there is no distance or no camera location."""
+        dists = np.asarray(dists, dtype=np.float64)
+        if not self.located: return [None] * len(dists)
+        valid = np.isfinite(dists) & (dists > 0)
+        coords = project(self.lng, self.lat, np.where(valid, dists, 0.0), self.bearing)
+        return [c.tolist() if ok else None for c, ok in zip(coords, valid)]
+
+
+def _number(attr, default):
+    value = attr.get("value", default) if isinstance(attr, dict) else default
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def parse_pose(camera_meta):
+    """NGSI camera attributes (location, rotationAngle, calibrationConstant) -> CameraPose."""
+    if not camera_meta: return CameraPose()
+    coords = ((camera_meta.get("location") or {}).get("value") or {}).get("coordinates")
+    lng = lat = None
+    if coords and len(coords) >= 2:
+        try:
+            lng, lat = float(coords[0]), float(coords[1])    # GeoJSON is [Lng, Lat]
+        except (TypeError, ValueError):
+            pass
+    return CameraPose(
+        lng, lat,
+        bearing=_number(camera_meta.get("rotationAngle"), 0.0),
+        calibration=_number(camera_meta.get("calibrationConstant"), 1.0)
+    )
+
+
+class PoseCache:
+    """Parsed CameraPose per camera, re-parsed only when its raw attributes change."""
+
+    def __init__(self):
+        self.poses = {}      # camera_id -> (raw attribute values, CameraPose)
+
+    def get(self, camera_id, camera_meta):
+        if not camera_meta: return CameraPose()
+        raw = tuple((camera_meta.get(key) or {}).get("value") for key in ("location", "rotationAngle", "calibrationConstant"))
+        cached = self.poses.get(camera_id)
+        if cached is not None and cached[0] == raw:
+            return cached[1]
+        pose = parse_pose(camera_meta)
+        self.poses[camera_id] = (raw, pose)
+        return pose